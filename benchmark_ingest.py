@@ -0,0 +1,116 @@
+"""
+Benchmark of the PDF ingestion write path.
+
+Compares the original per-term write loop (which rebuilt a Counter for
+every unique term and issued one INSERT per row) with the current
+PDFTextAnalyzer write path on a synthetic multi-page document. PDF
+extraction is skipped so only tokenization, TF calculation and the
+database writes are measured.
+
+Usage:
+    python benchmark_ingest.py --pages 500 --docs 1
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from collections import Counter
+
+from pageRank import PDFTextAnalyzer
+
+
+def make_document(pages: int, words_per_page: int, vocabulary_size: int, seed: int) -> str:
+    """Build a synthetic document with a Zipf-like word distribution."""
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    vocabulary = ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10)))
+                  for _ in range(vocabulary_size)]
+    weights = [1.0 / (rank + 1) for rank in range(vocabulary_size)]
+    page_texts = []
+    for _ in range(pages):
+        page_texts.append(" ".join(rng.choices(vocabulary, weights, k=words_per_page)))
+    return "\n".join(page_texts)
+
+
+# The original schema, recreated under separate table names so the legacy
+# write path can run next to the current one
+LEGACY_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS legacy_documents (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename TEXT UNIQUE NOT NULL,
+        content TEXT NOT NULL,
+        word_count INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS legacy_term_frequency (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        document_id INTEGER,
+        term TEXT,
+        frequency INTEGER,
+        tf_score REAL,
+        UNIQUE(document_id, term)
+    );
+'''
+
+
+def legacy_store(analyzer: PDFTextAnalyzer, filename: str, text: str):
+    """The write path as it was before the executemany rewrite."""
+    words = analyzer.preprocess_text(text)
+    tf_scores = analyzer.calculate_term_frequency(words)
+    conn = sqlite3.connect(analyzer.db_path)
+    conn.executescript(LEGACY_SCHEMA)
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT OR REPLACE INTO legacy_documents (filename, content, word_count)
+        VALUES (?, ?, ?)
+    ''', (filename, text, len(words)))
+    document_id = cursor.lastrowid
+    cursor.execute('DELETE FROM legacy_term_frequency WHERE document_id = ?', (document_id,))
+    for term, tf_score in tf_scores.items():
+        frequency = Counter(words)[term]
+        cursor.execute('''
+            INSERT INTO legacy_term_frequency (document_id, term, frequency, tf_score)
+            VALUES (?, ?, ?, ?)
+        ''', (document_id, term, frequency, tf_score))
+    conn.commit()
+    conn.close()
+
+
+def current_store(analyzer: PDFTextAnalyzer, filename: str, text: str):
+    """The write path used by process_pdf."""
+    words = analyzer.preprocess_text(text)
+    analyzer.storage.add_document(filename, Counter(words), len(words), text)
+
+
+def run(store, documents, label: str) -> float:
+    """Ingest every document into a fresh database and report docs/sec."""
+    with tempfile.TemporaryDirectory() as tmp:
+        with PDFTextAnalyzer(os.path.join(tmp, "bench.db")) as analyzer:
+            start = time.perf_counter()
+            for i, text in enumerate(documents):
+                store(analyzer, f"doc{i}.pdf", text)
+            elapsed = time.perf_counter() - start
+    rate = len(documents) / elapsed
+    print(f"{label:<10} {elapsed:8.2f}s  {rate:8.3f} docs/sec")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--docs", type=int, default=1)
+    args = parser.parse_args()
+
+    documents = [make_document(args.pages, args.words_per_page, args.vocabulary, seed)
+                 for seed in range(args.docs)]
+    print(f"{args.docs} documents x {args.pages} pages x {args.words_per_page} words")
+    before = run(legacy_store, documents, "before")
+    after = run(current_store, documents, "after")
+    print(f"speedup    {after / before:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,14 +17,12 @@ def example_usage():
         # Add your PDF file paths here
     ]
     
-    # Process each PDF file
-    for pdf_file in pdf_files:
-        print(f"Processing {pdf_file}...")
-        success = analyzer.process_pdf(pdf_file)
-        if success:
-            print(f"✓ Successfully processed {pdf_file}")
+    # Process the PDF files in parallel
+    for status in analyzer.process_pdfs(pdf_files):
+        if status.success:
+            print(f"✓ Successfully processed {status.path}")
         else:
-            print(f"✗ Failed to process {pdf_file}")
+            print(f"✗ Failed to process {status.path}: {status.error}")
     
     # Example searches with different queries
     search_queries = [
@@ -47,6 +45,9 @@ def example_usage():
     # List all documents in database
     print("\n" + "="*50)
     analyzer.list_documents()
+    
+    # Release the analyzer's database connections
+    analyzer.close()
 
 if __name__ == "__main__":
     example_usage()
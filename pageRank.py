@@ -1,9 +1,25 @@
 import sqlite3
 import re
 import math
-from collections import Counter, defaultdict
-from typing import Dict, List, Tuple
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import hashlib
+import io
+import json
 import os
+import threading
+import urllib.parse
+import uuid
+import zlib
+
+from storage import (CollectionStats, DocumentStats, SegmentStorage, StorageBackend,
+                     write_segment)
 
 try:
     import PyPDF2
@@ -11,17 +27,1356 @@ except ImportError:
     print("PyPDF2 not installed. Install with: pip install PyPDF2")
     exit(1)
 
-class PDFTextAnalyzer:
-    def __init__(self, db_path: str = "pdf_database.db"):
-        """Initialize the PDF analyzer with SQLite database."""
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    # Only needed by the optional sparse search engine and the vectorized
+    # PageRank iteration
+    np = None
+    sparse = None
+
+# stopwords were generated by AI 
+# Common stop words removed during preprocessing
+STOP_WORDS = frozenset({'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 
+                        'to', 'for', 'of', 'with', 'by', 'is', 'are', 'was', 'were',
+                        'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did',
+                        'will', 'would', 'could', 'should', 'may', 'might', 'must',
+                        'this', 'that', 'these', 'those', 'i', 'you', 'he', 'she',
+                        'it', 'we', 'they', 'me', 'him', 'her', 'us', 'them'})
+
+NON_LETTERS = re.compile(r'[^a-zA-Z\s]')
+
+# File names of PDFs mentioned in a document's text, e.g. "see survey.pdf"
+PDF_MENTION = re.compile(r'[\w\-.]+\.pdf\b', re.IGNORECASE)
+
+# Positional query syntax: "exact phrases" and word NEAR/n word; the right
+# operand is matched by lookahead so chains like a NEAR/2 b NEAR/3 c work
+PHRASE = re.compile(r'"([^"]*)"')
+NEAR = re.compile(r'(\S+)\s+NEAR/(\d+)\s+(?=(\S+))')
+NEAR_OPERATOR = re.compile(r'\bNEAR/\d+\b')
+
+# Boolean query syntax: AND/OR/NOT, parentheses and +required/-excluded
+BOOLEAN_SYNTAX = re.compile(r'(?:^|[\s(])[+\-]|[()]|\b(?:AND|OR|NOT)\b')
+QUERY_TOKEN = re.compile(r'"[^"]*"|[()]|(?<![^\s(])[+\-]|[^\s()"]+')
+
+# Prefix and wildcard terms (learn*, wom?n) outside quoted phrases. A ? is
+# a wildcard only when a letter or * follows it, so the question mark ending
+# "data analysis?" stays punctuation
+WILDCARD_TERM = re.compile(r'"[^"]*"|[a-zA-Z]*(?:\*|\?+(?=[a-zA-Z*]))'
+                           r'(?:[a-zA-Z*]|\?+(?=[a-zA-Z*]))*')
+WILDCARD_CHARS = re.compile(r'[*?]')
+
+# Query words missing from the index are corrected to vocabulary terms at
+# most this many edits away, found through a SymSpell deletion index over
+# the first FUZZY_PREFIX_LENGTH letters of every term; the FUZZY_EXPANSIONS
+# most frequent of the closest terms are searched instead. Words of up to
+# FUZZY_SHORT_WORD letters are allowed one edit only, as two edits of a short
+# word match a large part of the vocabulary
+FUZZY_MAX_DISTANCE = 2
+FUZZY_PREFIX_LENGTH = 7
+FUZZY_EXPANSIONS = 3
+FUZZY_SHORT_WORD = 5
+
+# zlib level for stored document text (1 is fastest, 9 smallest)
+CONTENT_COMPRESSION_LEVEL = 6
+
+# Marks put around query terms in search_detailed snippets
+HIGHLIGHT_MARKERS = ('**', '**')
+
+# A term joining a boolean AND is read in full when its posting list is at
+# most this many times longer than the candidates; otherwise only the
+# candidates are looked up in its index range
+RESTRICT_RATIO = 8
+
+
+@dataclass
+class IngestStatus:
+    """Outcome of ingesting a single PDF file."""
+    path: str
+    filename: str
+    success: bool
+    unique_terms: int = 0
+    error: Optional[str] = None
+    skipped: bool = False
+
+
+@dataclass
+class QueryNode:
+    """Node of a parsed boolean query.
+    
+    op is 'term', 'phrase' or 'near' for leaves (value holds the word, the
+    phrase's (offset, word) tuple or a (word, distance, word) tuple), 'and',
+    'or' and 'not' for operators, and 'all' for every document.
+    """
+    op: str
+    children: List['QueryNode'] = field(default_factory=list)
+    value: object = None
+
+
+@dataclass
+class CacheInfo:
+    """Hit and miss counters and occupancy of a ResultCache."""
+    hits: int
+    misses: int
+    size: int
+    max_size: int
+
+
+@dataclass
+class PageMatch:
+    """A page of a search result, its score and a snippet of its text."""
+    page: int
+    score: float
+    snippet: str
+
+
+@dataclass
+class SearchResult:
+    """A document found by search_detailed and its best-matching pages."""
+    filename: str
+    score: float
+    pages: List[PageMatch]
+
+
+def _analyze_pdf(analyzer_cls, pdf_path: str, positional: bool = False):
+    """Extract, tokenize and score a PDF inside a worker process.
+
+    Runs without touching the database so it can be executed in parallel;
+    the parent process is the only writer.
+    """
+    # Skip __init__ so workers never open the database
+    analyzer = analyzer_cls.__new__(analyzer_cls)
+    content, term_counts, word_count, links, positions, pages = analyzer._extract_and_count(
+        pdf_path, positional)
+    if not content:
+        return None, "No text extracted"
+    if not word_count:
+        return None, "No valid words found"
+    return (content, word_count, term_counts, links, positions, pages), None
+
+
+def encode_positions(positions: Iterable[int]) -> bytes:
+    """Encode ascending token positions as deltas in LEB128 varints.
+    
+    Gaps between occurrences of a term are mostly small, so the typical
+    position takes one or two bytes.
+    """
+    encoded = bytearray()
+    previous = 0
+    for position in positions:
+        delta = position - previous
+        previous = position
+        while delta >= 0x80:
+            encoded.append((delta & 0x7F) | 0x80)
+            delta >>= 7
+        encoded.append(delta)
+    return bytes(encoded)
+
+
+def decode_positions(blob: bytes) -> List[int]:
+    """Decode token positions written by encode_positions."""
+    positions = []
+    position = delta = shift = 0
+    for byte in blob:
+        delta |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            position += delta
+            positions.append(position)
+            delta = shift = 0
+    return positions
+
+
+def term_deletes(term: str, max_distance: int = FUZZY_MAX_DISTANCE) -> Dict[str, int]:
+    """Strings left after deleting up to max_distance letters of the term's prefix.
+    
+    Maps each string to the fewest deletions that produce it. Two words
+    within n edits of each other share a string both reach in at most n
+    deletions, which is what the SymSpell deletion index looks up. Only
+    the first FUZZY_PREFIX_LENGTH letters are used, which bounds the number
+    of deletes per term.
+    """
+    prefix = term[:FUZZY_PREFIX_LENGTH]
+    deletes = {prefix: 0}
+    frontier = {prefix}
+    for deletions in range(1, max_distance + 1):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        for word in frontier:
+            deletes.setdefault(word, deletions)
+    return deletes
+
+
+def edit_distance(left: str, right: str, max_distance: int) -> int:
+    """Damerau-Levenshtein (optimal string alignment) distance, capped.
+    
+    Returns max_distance + 1 as soon as the distance is known to exceed
+    max_distance. Common prefixes and suffixes are skipped and only the
+    diagonal band of width 2 * max_distance + 1 is computed.
+    """
+    too_far = max_distance + 1
+    if abs(len(left) - len(right)) > max_distance:
+        return too_far
+    start = 0
+    while start < len(left) and start < len(right) and left[start] == right[start]:
+        start += 1
+    end = 0
+    while end < len(left) - start and end < len(right) - start and \
+            left[-1 - end] == right[-1 - end]:
+        end += 1
+    left = left[start:len(left) - end]
+    right = right[start:len(right) - end]
+    if not left or not right:
+        return min(max(len(left), len(right)), too_far)
+    
+    width = len(right)
+    before = None
+    previous = [min(j, too_far) for j in range(width + 1)]
+    for i in range(1, len(left) + 1):
+        current = [too_far] * (width + 1)
+        current[0] = min(i, too_far)
+        for j in range(max(1, i - max_distance), min(width, i + max_distance) + 1):
+            distance = min(previous[j] + 1, current[j - 1] + 1,
+                           previous[j - 1] + (left[i - 1] != right[j - 1]))
+            if i > 1 and j > 1 and left[i - 1] == right[j - 2] and left[i - 2] == right[j - 1]:
+                # Transposition of two adjacent letters
+                distance = min(distance, before[j - 2] + 1)
+            current[j] = min(distance, too_far)
+        if min(current) >= too_far:
+            return too_far
+        before, previous = previous, current
+    return previous[width]
+
+
+def encode_page_counts(page_counts: Iterable[Tuple[int, int]]) -> bytes:
+    """Encode (page number, count) pairs with ascending pages in LEB128 varints.
+    
+    Each pair is stored as the gap to the previous page and the count.
+    """
+    encoded = bytearray()
+    previous = 0
+    for page, count in page_counts:
+        for value in (page - previous, count):
+            while value >= 0x80:
+                encoded.append((value & 0x7F) | 0x80)
+                value >>= 7
+            encoded.append(value)
+        previous = page
+    return bytes(encoded)
+
+
+def decode_page_counts(blob: bytes) -> List[Tuple[int, int]]:
+    """Decode (page number, count) pairs written by encode_page_counts."""
+    values = []
+    value = shift = 0
+    for byte in blob:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    page_counts = []
+    page = 0
+    for gap, count in zip(values[::2], values[1::2]):
+        page += gap
+        page_counts.append((page, count))
+    return page_counts
+
+
+def content_chunks(text: str, page_spans: List[Tuple[int, int]]) -> List[str]:
+    """Split document text at its page starts into the chunks stored for it.
+    
+    Chunk n starts with page n and runs up to the next page, so the chunks
+    concatenate back to the text. Without page ranges the text is one chunk.
+    """
+    bounds = [0] + [start for start, length in page_spans[1:]] + [len(text)]
+    return [text[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def fts_document(term_counts: Iterable[Tuple[str, int]]) -> str:
+    """The text indexed in document_fts for a document's (term, count) pairs.
+    
+    Each term is repeated count times, in term order, so the same text can
+    be rebuilt from term_frequency to delete the document again.
+    """
+    return ' '.join(' '.join([term] * count) for term, count in sorted(term_counts))
+
+
+def compress_text(text: str) -> bytes:
+    """Compress text for storage with zlib."""
+    return zlib.compress(text.encode('utf-8'), CONTENT_COMPRESSION_LEVEL)
+
+
+def decompress_text(blob: bytes, limit: Optional[int] = None) -> str:
+    """Decompress text written by compress_text, optionally only its first limit characters."""
+    if limit is None:
+        return zlib.decompress(blob).decode('utf-8')
+    # A character takes at most 4 bytes of UTF-8; a character cut at the
+    # end is dropped
+    data = zlib.decompressobj().decompress(blob, 4 * limit)
+    return data.decode('utf-8', 'ignore')[:limit]
+
+
+def _gallop(sequence, target: int, low: int, high: int) -> int:
+    """First index in sequence[low:high] whose value is >= target.
+    
+    Probes 1, 2, 4, ... entries ahead of low before binary searching, so
+    advancing a cursor costs the log of the distance skipped.
+    """
+    step = 1
+    bound = low
+    while bound < high and sequence[bound] < target:
+        low = bound + 1
+        bound += step
+        step *= 2
+    return bisect_left(sequence, target, low, min(bound, high))
+
+
+def intersect_postings(postings: List[Tuple[object, int, int]]) -> List[int]:
+    """Intersect sorted document id lists given as (sequence, start, end) slices.
+    
+    The shortest list drives and the others are advanced by galloping, so
+    the cost is proportional to the shortest list (times a log factor).
+    """
+    postings = sorted(postings, key=lambda item: item[2] - item[1])
+    sequence, start, end = postings[0]
+    others = postings[1:]
+    cursors = [other_start for other, other_start, other_end in others]
+    matches = []
+    for i in range(start, end):
+        doc_id = sequence[i]
+        for k, (other, other_start, other_end) in enumerate(others):
+            position = _gallop(other, doc_id, cursors[k], other_end)
+            cursors[k] = position
+            if position == other_end:
+                return matches
+            if other[position] != doc_id:
+                break
+        else:
+            matches.append(doc_id)
+    return matches
+
+
+def subtract_postings(postings: Tuple[object, int, int],
+                      excluded: Tuple[object, int, int]) -> List[int]:
+    """Sorted document ids in postings but not in excluded, galloping through excluded."""
+    sequence, start, end = postings
+    other, cursor, other_end = excluded
+    kept = []
+    for i in range(start, end):
+        doc_id = sequence[i]
+        cursor = _gallop(other, doc_id, cursor, other_end)
+        if cursor == other_end or other[cursor] != doc_id:
+            kept.append(doc_id)
+    return kept
+
+
+def union_postings(postings: Iterable[Tuple[object, int, int]]) -> List[int]:
+    """Merge sorted document id lists given as (sequence, start, end) slices.
+    
+    The slices are concatenated and sorted, which merges their sorted runs
+    in linear passes, and duplicates are dropped in order.
+    """
+    merged = []
+    for sequence, start, end in postings:
+        merged.extend(sequence[start:end])
+    merged.sort()
+    return list(dict.fromkeys(merged))
+
+
+def _whole(sequence) -> Tuple[object, int, int]:
+    """A whole sorted sequence as a (sequence, start, end) slice."""
+    return sequence, 0, len(sequence)
+
+
+def _combine_nodes(op: str, nodes: Iterable[Optional[QueryNode]]) -> Optional[QueryNode]:
+    """Join query nodes with 'and' or 'or', flattening nested nodes of the same kind."""
+    children = []
+    for node in nodes:
+        if node is None:
+            continue
+        if node.op == 'required':
+            node = node.children[0]
+        if node.op == op:
+            children.extend(node.children)
+        else:
+            children.append(node)
+    if op == 'and' and any(child.op not in ('all', 'not') for child in children):
+        # Every document is implied by any positive clause
+        children = [child for child in children if child.op != 'all']
+    if not children:
+        return None
+    if len(children) == 1:
+        return children[0]
+    return QueryNode(op, children)
+
+
+def _within_distance(left: List[int], right: List[int], distance: int) -> bool:
+    """Whether two ascending position lists have entries at most distance apart."""
+    i = j = 0
+    while i < len(left) and j < len(right):
+        if abs(left[i] - right[j]) <= distance:
+            return True
+        if left[i] < right[j]:
+            i += 1
+        else:
+            j += 1
+    return False
+
+
+def _link_target(uri: str) -> Optional[str]:
+    """File name of the PDF a link URI points to, or None for other links."""
+    filename = os.path.basename(urllib.parse.unquote(urllib.parse.urlparse(uri).path))
+    return filename if filename.lower().endswith('.pdf') else None
+
+
+def pagerank(sources: List[int], targets: List[int], node_count: int,
+             damping: float = 0.85, tolerance: float = 1e-6, max_iterations: int = 100,
+             initial: Optional[List[Optional[float]]] = None) -> Tuple[List[float], int]:
+    """PageRank of a directed graph by power iteration.
+    
+    Edge i runs from node sources[i] to node targets[i]; nodes are numbered
+    0..node_count-1. Dangling nodes spread their rank evenly over all nodes.
+    initial warm-starts the iteration (missing values count as 1/N), so
+    recomputing after a small change to the graph takes few iterations.
+    Iterates until the L1 change drops below tolerance and returns the ranks,
+    which sum to 1, and the number of iterations. Uses a SciPy sparse matrix
+    when available.
+    """
+    if node_count == 0:
+        return [], 0
+    uniform = 1.0 / node_count
+    ranks = [uniform if rank is None else rank for rank in initial] if initial else \
+        [uniform] * node_count
+    total = sum(ranks)
+    ranks = [rank / total for rank in ranks] if total > 0 else [uniform] * node_count
+    teleport = (1 - damping) / node_count
+    iteration = 0
+    
+    if np is not None:
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        out_degree = np.bincount(sources, minlength=node_count).astype(np.float64)
+        # Column s of the transition matrix spreads s's rank over its links
+        transition = sparse.csr_matrix((1.0 / out_degree[sources], (targets, sources)),
+                                       shape=(node_count, node_count))
+        dangling = out_degree == 0
+        ranks = np.array(ranks)
+        for iteration in range(1, max_iterations + 1):
+            spread = damping * (transition @ ranks + ranks[dangling].sum() / node_count)
+            updated = spread + teleport
+            change = np.abs(updated - ranks).sum()
+            ranks = updated
+            if change < tolerance:
+                break
+        return ranks.tolist(), iteration
+    
+    out_degree = [0] * node_count
+    for source in sources:
+        out_degree[source] += 1
+    dangling = [node for node in range(node_count) if not out_degree[node]]
+    edges = list(zip(sources, targets))
+    for iteration in range(1, max_iterations + 1):
+        dangling_mass = sum(ranks[node] for node in dangling)
+        updated = [teleport + damping * dangling_mass / node_count] * node_count
+        for source, target in edges:
+            updated[target] += damping * ranks[source] / out_degree[source]
+        change = sum(abs(new - old) for new, old in zip(updated, ranks))
+        ranks = updated
+        if change < tolerance:
+            break
+    return ranks, iteration
+
+
+# Relative slack on score upper bounds, so floating point rounding in the
+# summed bounds never prunes a document that belongs in the top k
+BOUND_SLACK = 1 + 1e-9
+
+RANKINGS = ('tfidf', 'bm25')
+
+# search_many loads shared postings once the queries would read each posting
+# this many times on average
+SHARED_POSTINGS_RATIO = 1.5
+
+# Values per IN (...) list, well below SQLite's host parameter limit
+IN_CLAUSE_CHUNK = 500
+
+
+def _in_clause_filters(column: str, values: Optional[Iterable]) -> List[Tuple[str, list]]:
+    """WHERE clauses with parameters restricting column to values, in chunks.
+    
+    values of None means no restriction and gives a single empty clause.
+    """
+    if values is None:
+        return [('', [])]
+    values = sorted(set(values))
+    filters = []
+    for i in range(0, len(values), IN_CLAUSE_CHUNK):
+        chunk = values[i:i + IN_CLAUSE_CHUNK]
+        filters.append((f"WHERE {column} IN ({', '.join(['?'] * len(chunk))})", chunk))
+    return filters
+
+
+def bm25_idf(total_docs: float, doc_freq: int) -> float:
+    """BM25 inverse document frequency; unlike log(N/df) it stays positive."""
+    return math.log(1 + (total_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+
+class InMemoryIndex:
+    """Read-only snapshot of the index held in RAM for fast searching.
+    
+    The postings of all terms are kept in flat arrays (document ids, TF
+    scores and raw frequencies) ordered by term and document id, and every
+    term maps to its slice of them. Queries are evaluated document-at-a-time
+    with MaxScore pruning, using the per-term maximum TF stored in
+    term_stats. PageRank blending scales each document's score by
+    ``1 - w + w * relative rank``, where a relative rank of 1 is an average
+    document, and the bounds by the largest such factor. The snapshot
+    remembers the index generation it was loaded at so the analyzer can tell
+    when it is stale.
+    """
+    
+    def __init__(self, generation: float, total_docs: float, total_words: float,
+                 doc_names: Dict[int, str], doc_lengths: Dict[int, int],
+                 term_slices: Dict[str, Tuple[int, int]], doc_ids: array, tf_scores: array,
+                 frequencies: array, max_tf_scores: Dict[str, float],
+                 relative_ranks: Optional[Dict[int, float]] = None):
+        self.generation = generation
+        self.total_docs = total_docs
+        self.total_words = total_words
+        self.doc_names = doc_names
+        self.doc_lengths = doc_lengths
+        self.term_slices = term_slices
+        self.doc_ids = doc_ids
+        self.tf_scores = tf_scores
+        self.frequencies = frequencies
+        self.max_tf_scores = max_tf_scores
+        # PageRank times the number of documents; unranked documents count as 1
+        self.relative_ranks = relative_ranks or {}
+        self.max_relative_rank = max(self.relative_ranks.values(), default=1.0)
+        # Position of every document in filename order, used to break ties
+        self.doc_ranks = {doc_id: rank for rank, doc_id
+                          in enumerate(sorted(doc_names, key=doc_names.get))}
+        self._bm25_norms: Dict[Tuple[float, float], Dict[int, float]] = {}
+    
+    def close(self):
+        """Release the index's resources; a snapshot in RAM holds none."""
+    
+    @classmethod
+    def load(cls, cursor, terms: Optional[Iterable[str]] = None) -> 'InMemoryIndex':
+        """Load a consistent snapshot of the index through an open cursor.
+        
+        With terms, only the postings of those terms are loaded.
+        """
+        cursor.execute('''
+            SELECT key, value FROM collection_stats
+            WHERE key IN ('generation', 'total_docs', 'total_words')
+        ''')
+        stats = dict(cursor.fetchall())
+        
+        total_docs = stats.get('total_docs', 0)
+        cursor.execute('SELECT id, filename, word_count, pagerank FROM documents')
+        doc_names = {}
+        doc_lengths = {}
+        relative_ranks = {}
+        for doc_id, filename, word_count, rank in cursor.fetchall():
+            doc_names[doc_id] = filename
+            doc_lengths[doc_id] = word_count or 0
+            if rank is not None:
+                relative_ranks[doc_id] = rank * total_docs
+        term_names = {}
+        max_tf_scores = {}
+        for where, params in _in_clause_filters('t.term', terms):
+            cursor.execute(f'''
+                SELECT t.id, t.term, s.max_tf_score
+                FROM terms t
+                LEFT JOIN term_stats s ON s.term_id = t.id
+                {where}
+            ''', params)
+            for term_id, term, max_tf_score in cursor.fetchall():
+                term_names[term_id] = term
+                if max_tf_score is not None:
+                    max_tf_scores[term] = max_tf_score
+        
+        term_slices = {}
+        doc_ids = array('q')
+        tf_scores = array('d')
+        frequencies = array('q')
+        current_term, start = None, 0
+        # Walks the covering (term_id, document_id, tf_score, frequency)
+        # index in order; chunks of sorted term ids keep that order overall
+        term_ids = None if terms is None else term_names
+        for where, params in _in_clause_filters('term_id', term_ids):
+            cursor.execute(f'''
+                SELECT term_id, document_id, tf_score, frequency FROM term_frequency
+                {where}
+                ORDER BY term_id, document_id
+            ''', params)
+            for term_id, document_id, tf_score, frequency in cursor:
+                if document_id not in doc_names:
+                    continue
+                if term_id != current_term:
+                    if current_term is not None:
+                        term_slices[term_names[current_term]] = (start, len(doc_ids))
+                    current_term, start = term_id, len(doc_ids)
+                doc_ids.append(document_id)
+                tf_scores.append(tf_score)
+                frequencies.append(frequency)
+        if current_term is not None:
+            term_slices[term_names[current_term]] = (start, len(doc_ids))
+        
+        return cls(stats.get('generation', 0), total_docs,
+                   stats.get('total_words', 0), doc_names, doc_lengths, term_slices,
+                   doc_ids, tf_scores, frequencies, max_tf_scores, relative_ranks)
+    
+    @classmethod
+    def from_storage(cls, storage: StorageBackend) -> 'InMemoryIndex':
+        """Load a snapshot of any storage backend (see storage.py)."""
+        stats = storage.collection_stats()
+        doc_names = {}
+        doc_lengths = {}
+        relative_ranks = {}
+        for doc_id, document in storage.documents():
+            doc_names[doc_id] = document.filename
+            doc_lengths[doc_id] = document.word_count
+            if document.pagerank is not None:
+                relative_ranks[doc_id] = document.pagerank * stats.total_docs
+        
+        term_slices = {}
+        max_tf_scores = {}
+        doc_ids = array('q')
+        tf_scores = array('d')
+        frequencies = array('q')
+        for term in storage.terms():
+            term_doc_ids, term_frequencies = storage.postings(term)
+            start = len(doc_ids)
+            doc_ids.extend(term_doc_ids)
+            frequencies.extend(term_frequencies)
+            tf_scores.extend(frequency / (doc_lengths[doc_id] or 1)
+                             for doc_id, frequency in zip(term_doc_ids, term_frequencies))
+            term_slices[term] = (start, len(doc_ids))
+            max_tf_scores[term] = max(tf_scores[start:], default=0.0)
+        
+        return cls(stats.generation, stats.total_docs, stats.total_words, doc_names,
+                   doc_lengths, term_slices, doc_ids, tf_scores, frequencies, max_tf_scores,
+                   relative_ranks)
+    
+    def postings(self, term: str) -> Tuple[array, int, int]:
+        """The term's sorted document ids as a (doc_ids, start, end) slice."""
+        start, end = self.term_slices.get(term, (0, 0))
+        return self.doc_ids, start, end
+    
+    def bm25_norms(self, k1: float, b: float) -> Dict[int, float]:
+        """Per-document BM25 length normalization k1 * (1 - b + b * dl / avgdl)."""
+        norms = self._bm25_norms.get((k1, b))
+        if norms is None:
+            average_length = self.total_words / self.total_docs if self.total_docs else 0
+            average_length = average_length or 1.0
+            norms = {doc_id: k1 * (1 - b + b * length / average_length)
+                     for doc_id, length in self.doc_lengths.items()}
+            self._bm25_norms[(k1, b)] = norms
+        return norms
+    
+    def search(self, query_counts: Dict[str, int], top_n: int, ranking: str = 'tfidf',
+               k1: float = 1.2, b: float = 0.75,
+               pagerank_weight: float = 0.0) -> List[Tuple[str, float]]:
+        """Score documents for distinct query terms and their repeat counts.
+        
+        Keeps the best top_n documents in a bounded heap and applies
+        MaxScore: query terms are ordered by their score upper bound, and
+        the terms whose bounds together cannot lift a document above the
+        current k-th best score become non-essential. Only documents in an
+        essential term's postings are candidates, and non-essential postings
+        are probed by binary search only while the candidate can still make
+        the top k.
+        """
+        # (upper bound, weight, posting position, posting end) per term
+        terms = []
+        for term, count in query_counts.items():
+            if term not in self.term_slices:
+                continue
+            start, end = self.term_slices[term]
+            if ranking == 'bm25':
+                # f / (f + norm) < 1, so the weight itself bounds a posting
+                weight = bm25_idf(self.total_docs, end - start) * count * (k1 + 1)
+                bound = weight
+            else:
+                idf = math.log(self.total_docs / (end - start))
+                if idf <= 0:
+                    continue
+                weight = idf * count
+                bound = weight * self.max_tf_scores.get(term, 1.0)
+            terms.append((bound, weight, start, end))
+        if not terms or top_n <= 0:
+            return []
+        
+        terms.sort()
+        weights = [weight for bound, weight, start, end in terms]
+        positions = [start for bound, weight, start, end in terms]
+        ends = [end for bound, weight, start, end in terms]
+        # bound_sums[i] is the most terms[0..i] can add to any document
+        bound_sums = []
+        total = 0.0
+        for bound, weight, start, end in terms:
+            total += bound
+            bound_sums.append(total * BOUND_SLACK)
+        
+        doc_ids, doc_ranks = self.doc_ids, self.doc_ranks
+        tf_scores, frequencies = self.tf_scores, self.frequencies
+        norms = self.bm25_norms(k1, b) if ranking == 'bm25' else None
+        relative_ranks = self.relative_ranks
+        max_boost = 1 - pagerank_weight + pagerank_weight * max(self.max_relative_rank, 1.0)
+        boost = 1.0
+        heap = []  # (score, -rank, doc_id); the root is the current k-th best
+        threshold = 0.0
+        first_essential = 0
+        
+        while True:
+            # The next candidate is the smallest document id left in any
+            # essential posting list
+            candidate = None
+            for i in range(first_essential, len(terms)):
+                if positions[i] < ends[i]:
+                    doc_id = doc_ids[positions[i]]
+                    if candidate is None or doc_id < candidate:
+                        candidate = doc_id
+            if candidate is None:
+                break
+            norm = norms[candidate] if norms is not None else 0.0
+            if pagerank_weight:
+                boost = 1 - pagerank_weight + pagerank_weight * relative_ranks.get(candidate, 1.0)
+            
+            score = 0.0
+            for i in range(first_essential, len(terms)):
+                position = positions[i]
+                if position < ends[i] and doc_ids[position] == candidate:
+                    if norms is None:
+                        score += tf_scores[position] * weights[i]
+                    else:
+                        frequency = frequencies[position]
+                        score += weights[i] * frequency / (frequency + norm)
+                    positions[i] = position + 1
+            
+            # Probe non-essential terms, largest bound first, while the
+            # candidate can still reach the threshold
+            pruned = False
+            for i in range(first_essential - 1, -1, -1):
+                if (score + bound_sums[i]) * boost < threshold:
+                    pruned = True
+                    break
+                position = bisect_left(doc_ids, candidate, positions[i], ends[i])
+                positions[i] = position
+                if position < ends[i] and doc_ids[position] == candidate:
+                    if norms is None:
+                        score += tf_scores[position] * weights[i]
+                    else:
+                        frequency = frequencies[position]
+                        score += weights[i] * frequency / (frequency + norm)
+            score *= boost
+            if pruned or score <= 0:
+                continue
+            
+            entry = (score, -doc_ranks[candidate], candidate)
+            if len(heap) < top_n:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+            else:
+                continue
+            
+            if len(heap) == top_n:
+                threshold = heap[0][0]
+                while (first_essential < len(terms)
+                       and bound_sums[first_essential] * max_boost < threshold):
+                    first_essential += 1
+        
+        results = [(self.doc_names[doc_id], score) for score, rank, doc_id in heap]
+        results.sort(key=lambda item: (-item[1], item[0]))
+        return results
+    
+    def search_batch(self, queries: List[Dict[str, int]], top_n: int, ranking: str = 'tfidf',
+                     k1: float = 1.2, b: float = 0.75,
+                     pagerank_weight: float = 0.0) -> List[List[Tuple[str, float]]]:
+        """Score several queries against the snapshot."""
+        return [self.search(query_counts, top_n, ranking, k1, b, pagerank_weight)
+                for query_counts in queries]
+
+
+class SparseIndex:
+    """Vectorized scoring over a SciPy sparse document x term matrix.
+    
+    The tf_score matrix is stored column-compressed, so each column is one
+    term's posting list and multiplying it by a sparse query vector touches
+    only the query terms' postings. Many queries can be scored at once as a
+    single sparse matrix product; top-k selection uses argpartition. BM25
+    matrices are derived from the raw frequencies once per (k1, b).
+    """
+    
+    def __init__(self, generation: float, total_docs: float, doc_names: List[str],
+                 term_columns: Dict[str, int], matrix, frequencies, doc_lengths,
+                 average_length: float, relative_ranks=None):
+        self.generation = generation
+        self.total_docs = total_docs
+        self.doc_names = doc_names
+        self.term_columns = term_columns
+        self.matrix = matrix
+        self.frequencies = frequencies
+        self.doc_lengths = doc_lengths
+        self.average_length = average_length
+        self.relative_ranks = relative_ranks if relative_ranks is not None else \
+            np.ones(len(doc_names))
+        doc_freqs = np.diff(matrix.indptr)
+        with np.errstate(divide='ignore'):
+            self.idf = np.log(total_docs / np.maximum(doc_freqs, 1)) if total_docs else \
+                np.zeros(len(doc_freqs))
+        self.bm25_idf = np.log(1 + (total_docs - doc_freqs + 0.5) / (doc_freqs + 0.5))
+        self._bm25_matrices = {}
+    
+    def close(self):
+        """Release the index's resources; a matrix in RAM holds none."""
+    
+    @classmethod
+    def load(cls, cursor, terms: Optional[Iterable[str]] = None) -> 'SparseIndex':
+        """Build the sparse matrix and IDF vector from a snapshot of the index.
+        
+        With terms, only the columns of those terms are loaded.
+        """
+        return cls.from_index(InMemoryIndex.load(cursor, terms))
+    
+    @classmethod
+    def from_storage(cls, storage: StorageBackend) -> 'SparseIndex':
+        """Build the sparse matrix from any storage backend (see storage.py)."""
+        return cls.from_index(InMemoryIndex.from_storage(storage))
+    
+    @classmethod
+    def from_index(cls, base: InMemoryIndex) -> 'SparseIndex':
+        """Build the sparse matrix and IDF vector from an InMemoryIndex's postings."""
+        if np is None:
+            raise ImportError("The sparse engine needs NumPy and SciPy. "
+                              "Install with: pip install numpy scipy")
+        # Rows are documents ordered by id; columns are terms in the order
+        # their (contiguous) posting slices were loaded
+        row_doc_ids = np.array(sorted(base.doc_names), dtype=np.int64)
+        doc_names = [base.doc_names[doc_id] for doc_id in row_doc_ids.tolist()]
+        doc_lengths = np.array([base.doc_lengths[doc_id] for doc_id in row_doc_ids.tolist()],
+                               dtype=np.float64)
+        term_columns = {term: column for column, term in enumerate(base.term_slices)}
+        indptr = np.zeros(len(term_columns) + 1, dtype=np.int64)
+        indptr[1:] = [end for start, end in base.term_slices.values()]
+        
+        rows = np.searchsorted(row_doc_ids, np.frombuffer(base.doc_ids, dtype=np.int64))
+        data = np.frombuffer(base.tf_scores, dtype=np.float64)
+        matrix = sparse.csc_matrix((data, rows, indptr),
+                                   shape=(len(doc_names), len(term_columns)))
+        frequencies = np.frombuffer(base.frequencies, dtype=np.int64).astype(np.float64)
+        relative_ranks = np.array([base.relative_ranks.get(doc_id, 1.0)
+                                   for doc_id in row_doc_ids.tolist()], dtype=np.float64)
+        
+        average_length = base.total_words / base.total_docs if base.total_docs else 0
+        return cls(base.generation, base.total_docs, doc_names, term_columns, matrix,
+                   frequencies, doc_lengths, average_length or 1.0, relative_ranks)
+    
+    def bm25_matrix(self, k1: float, b: float):
+        """Matrix of f * (k1 + 1) / (f + k1 * (1 - b + b * dl / avgdl)) per posting."""
+        matrix = self._bm25_matrices.get((k1, b))
+        if matrix is None:
+            norms = k1 * (1 - b + b * self.doc_lengths / self.average_length)
+            data = self.frequencies * (k1 + 1) / (self.frequencies + norms[self.matrix.indices])
+            matrix = sparse.csc_matrix((data, self.matrix.indices, self.matrix.indptr),
+                                       shape=self.matrix.shape)
+            self._bm25_matrices[(k1, b)] = matrix
+        return matrix
+    
+    def search(self, query_counts: Dict[str, int], top_n: int, ranking: str = 'tfidf',
+               k1: float = 1.2, b: float = 0.75,
+               pagerank_weight: float = 0.0) -> List[Tuple[str, float]]:
+        """Score documents for distinct query terms and their repeat counts."""
+        return self.search_batch([query_counts], top_n, ranking, k1, b, pagerank_weight)[0]
+    
+    def search_batch(self, queries: List[Dict[str, int]], top_n: int, ranking: str = 'tfidf',
+                     k1: float = 1.2, b: float = 0.75,
+                     pagerank_weight: float = 0.0) -> List[List[Tuple[str, float]]]:
+        """Score several queries with one sparse matrix product."""
+        if ranking == 'bm25':
+            matrix, idf = self.bm25_matrix(k1, b), self.bm25_idf
+        else:
+            matrix, idf = self.matrix, self.idf
+        
+        rows, columns, weights = [], [], []
+        for column, query_counts in enumerate(queries):
+            for term, count in query_counts.items():
+                term_column = self.term_columns.get(term)
+                if term_column is None or idf[term_column] <= 0:
+                    continue
+                rows.append(term_column)
+                columns.append(column)
+                weights.append(idf[term_column] * count)
+        
+        query_matrix = sparse.csc_matrix((weights, (rows, columns)),
+                                         shape=(len(self.term_columns), len(queries)))
+        scores = (matrix @ query_matrix).tocsc()
+        
+        results = []
+        for column in range(len(queries)):
+            start, end = scores.indptr[column], scores.indptr[column + 1]
+            doc_rows, doc_scores = scores.indices[start:end], scores.data[start:end]
+            if pagerank_weight:
+                doc_scores = doc_scores * (1 - pagerank_weight +
+                                           pagerank_weight * self.relative_ranks[doc_rows])
+            results.append(self._top_k(doc_rows, doc_scores, top_n))
+        return results
+    
+    def _top_k(self, doc_rows, doc_scores, top_n: int) -> List[Tuple[str, float]]:
+        """Pick the top_n scores, breaking ties by filename like the SQL engine."""
+        positive = doc_scores > 0
+        doc_rows, doc_scores = doc_rows[positive], doc_scores[positive]
+        if top_n <= 0 or len(doc_scores) == 0:
+            return []
+        if len(doc_scores) > top_n:
+            best = np.argpartition(doc_scores, -top_n)[-top_n:]
+            # Keep every document tied with the k-th best score
+            keep = doc_scores >= doc_scores[best].min()
+            doc_rows, doc_scores = doc_rows[keep], doc_scores[keep]
+        
+        results = [(self.doc_names[row], float(score))
+                   for row, score in zip(doc_rows.tolist(), doc_scores.tolist())]
+        results.sort(key=lambda item: (-item[1], item[0]))
+        return results[:top_n]
+
+
+class SegmentIndex(InMemoryIndex):
+    """InMemoryIndex that searches an mmap'ed segment file instead of arrays in RAM.
+    
+    The segment (see storage.SegmentStorage) is kept next to the database
+    as <database>.segment. Loading maps it if it was written from this
+    database at the current index generation, and otherwise writes it anew
+    first, so after a change one process rewrites it and every process maps
+    the same file: postings are read from the shared page cache without
+    copying, and only the document names, lengths and ranks are held in
+    each process's RAM.
+    """
+    
+    def __init__(self, segment: SegmentStorage):
+        self.segment = segment
+        doc_names = {}
+        doc_lengths = {}
+        relative_ranks = {}
+        for doc_id, document in segment.documents():
+            doc_names[doc_id] = document.filename
+            doc_lengths[doc_id] = document.word_count
+            if document.pagerank is not None:
+                relative_ranks[doc_id] = document.pagerank * segment.total_docs
+        super().__init__(segment.generation, segment.total_docs, segment.total_words,
+                         doc_names, doc_lengths, segment.term_slices, segment.doc_ids,
+                         segment.tf_scores, segment.frequencies, segment.max_tf_scores,
+                         relative_ranks)
+    
+    def close(self):
+        """Unmap the segment file."""
+        self.segment.close()
+    
+    @classmethod
+    def load(cls, cursor) -> 'SegmentIndex':
+        """Map the database's segment, writing it first if it is missing or stale."""
+        cursor.execute('PRAGMA database_list')
+        database = next(file for seq, name, file in cursor.fetchall() if name == 'main')
+        if not database:
+            raise ValueError("The segment engine needs a database file")
+        path = database + '.segment'
+        cursor.execute("SELECT value FROM collection_stats WHERE key = 'generation'")
+        row = cursor.fetchone()
+        generation = row[0] if row else 0
+        cursor.execute("SELECT value FROM database_info WHERE key = 'database_id'")
+        database_id = cursor.fetchone()[0]
+        
+        segment = None
+        if os.path.exists(path):
+            try:
+                segment = SegmentStorage(path)
+            except ValueError:
+                segment = None
+            if segment is not None and (segment.generation != generation or
+                                        segment.database_id != database_id):
+                segment.close()
+                segment = None
+        if segment is None:
+            snapshot = InMemoryIndex.load(cursor)
+            cursor.execute('SELECT id, pagerank FROM documents')
+            ranks = dict(cursor.fetchall())
+            write_segment(path, snapshot.generation, snapshot.total_docs, snapshot.total_words,
+                          ((doc_id, filename, snapshot.doc_lengths[doc_id], ranks.get(doc_id))
+                           for doc_id, filename in snapshot.doc_names.items()),
+                          ((term, snapshot.doc_ids[start:end], snapshot.frequencies[start:end],
+                            snapshot.tf_scores[start:end])
+                           for term, (start, end) in snapshot.term_slices.items()),
+                          database_id)
+            segment = SegmentStorage(path)
+        return cls(segment)
+
+
+def _sqlite_has_fts5() -> bool:
+    """Whether the SQLite library sqlite3 uses was built with FTS5."""
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute('CREATE VIRTUAL TABLE fts5_probe USING fts5(text)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+# Only needed by the optional fts5 search engine
+FTS5_AVAILABLE = _sqlite_has_fts5()
+
+
+# Search engines that serve queries from a snapshot of the index held in
+# memory; 'sql' (the default) and 'fts5' query the database directly
+INDEX_ENGINES = {
+    'memory': InMemoryIndex,
+    'sparse': SparseIndex,
+    'segment': SegmentIndex,
+}
+
+
+class ConnectionManager:
+    """Hands out one persistent, tuned SQLite connection per thread.
+    
+    Connections are opened lazily on first use in each thread and stay open
+    until close() is called, so callers do not pay connect/teardown per
+    operation. Each connection uses WAL journaling, synchronous=NORMAL and
+    the configured page cache, memory map and prepared-statement cache.
+    """
+    
+    def __init__(self, db_path: str, cache_size: int = -64000,
+                 mmap_size: int = 256 * 1024 * 1024, cached_statements: int = 256):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+    
+    def connection(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it if needed."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # check_same_thread is off only so close() can run from any
+            # thread; each connection is still used by a single thread
+            conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                                   cached_statements=self.cached_statements)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute(f'PRAGMA cache_size = {int(self.cache_size)}')
+            conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+    
+    def release(self, conn: sqlite3.Connection):
+        """Close one connection whose thread is done with the manager."""
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        conn.close()
+    
+    def close(self):
+        """Close every connection opened by this manager."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for conn in connections:
+            conn.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ResultCache:
+    """Bounded LRU cache of search results for one index generation.
+    
+    Entries belong to the index generation they were computed at; a lookup
+    with a different generation empties the cache, so any write to the
+    index invalidates every cached result.
+    """
+    
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, generation: float) -> Optional[List[Tuple[str, float]]]:
+        """Return the cached results for key, or None on a miss."""
+        with self._lock:
+            if generation != self.generation:
+                self._entries.clear()
+                self.generation = generation
+            results = self._entries.get(key)
+            if results is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(results)
+    
+    def put(self, key, generation: float, results: List[Tuple[str, float]]):
+        """Store results computed at the given generation."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = list(results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+    
+    def info(self) -> CacheInfo:
+        """Report hits, misses and current size."""
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, len(self._entries), self.max_size)
+
+
+class SQLiteStorage(StorageBackend):
+    """Storage backend keeping the index in an SQLite database.
+    
+    Besides postings and statistics the database holds each document's
+    compressed text, pages, token positions and links, the SymSpell
+    deletion index and, once enabled, an FTS5 index; PDFTextAnalyzer
+    searches it with SQL. Connections are handed out per thread by a
+    ConnectionManager, and the schema is created or upgraded on open.
+    Writes run in transaction(), which every process shares through the
+    database's write lock.
+    """
+    
+    def __init__(self, db_path: str = "pdf_database.db", cache_size: int = -64000,
+                 mmap_size: int = 256 * 1024 * 1024, cached_statements: int = 256):
         self.db_path = db_path
+        self.connections = ConnectionManager(db_path, cache_size, mmap_size, cached_statements)
+        # term -> id cache for ingestion, shared by all threads and guarded
+        # by _term_ids_lock. Ids created inside a transaction are staged per
+        # thread and only published once it commits.
+        self._term_ids: Dict[str, int] = {}
+        self._term_ids_lock = threading.Lock()
+        self._staged_term_ids = threading.local()
+        self._vocabulary_epoch = None
         self.init_database()
     
+    def close(self):
+        """Close the database connections of every thread."""
+        self.connections.close()
+    
+    @contextmanager
+    def transaction(self):
+        """Write lock and transaction for a block of writes; yields a cursor.
+        
+        Takes the lock with BEGIN IMMEDIATE and commits when the block ends,
+        or rolls back if it raises. Inside a transaction already open on the
+        thread's connection the block joins it, and its owner commits.
+        """
+        conn = self.connections.connection()
+        cursor = conn.cursor()
+        if conn.in_transaction:
+            yield cursor
+            return
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            yield cursor
+        except BaseException:
+            self._rollback(conn)
+            raise
+        self._commit(conn)
+    
+    def add_document(self, filename: str, term_counts: Dict[str, int], word_count: int,
+                     text="", links: Iterable[str] = (),
+                     positions: Optional[Dict[str, List[int]]] = None,
+                     pages: Optional[Tuple[List[Tuple[int, int]],
+                                           Dict[str, List[Tuple[int, int]]]]] = None) -> int:
+        """Add a document, replacing any document with the same filename; returns its id.
+        
+        See _store_document() for links, positions and pages. Inside
+        transaction() a failed document is rolled back alone, and the
+        error raised, without discarding the rest of the transaction.
+        """
+        tf_scores = {term: count / (word_count or 1) for term, count in term_counts.items()}
+        with self.transaction() as cursor:
+            cursor.execute('SAVEPOINT add_document')
+            try:
+                document_id = self._store_document(cursor, filename, text, word_count,
+                                                   term_counts, tf_scores, links, positions,
+                                                   pages)
+            except BaseException:
+                cursor.execute('ROLLBACK TO add_document')
+                cursor.execute('RELEASE add_document')
+                # Staged term ids may have been rolled back with it
+                self._staged_term_ids_for_thread().clear()
+                raise
+            cursor.execute('RELEASE add_document')
+        return document_id
+    
+    def remove_document(self, filename: str) -> bool:
+        """Remove a document, its postings, text and links; returns False if it is not stored."""
+        with self.transaction() as cursor:
+            cursor.execute('SELECT id, word_count FROM documents WHERE filename = ?', (filename,))
+            result = cursor.fetchone()
+            if not result:
+                return False
+            
+            self._delete_postings(cursor, result[0])
+            cursor.execute('DELETE FROM document_links WHERE source_id = ?', (result[0],))
+            if cursor.rowcount or self.is_link_target(cursor, filename):
+                self.add_collection_stat(cursor, 'links_generation', 1)
+            cursor.execute('DELETE FROM documents WHERE id = ?', (result[0],))
+            cursor.execute('DELETE FROM document_manifest WHERE filename = ?', (filename,))
+            self.add_collection_stat(cursor, 'total_docs', -1)
+            self.add_collection_stat(cursor, 'total_words', -(result[1] or 0))
+            self.add_collection_stat(cursor, 'generation', 1)
+        return True
+    
+    def _cursor(self):
+        return self.connections.connection().cursor()
+    
+    def postings(self, term: str) -> Tuple[Sequence[int], Sequence[int]]:
+        """The ids of the documents containing term and its frequency in each."""
+        cursor = self._cursor()
+        cursor.execute('''
+            SELECT tf.document_id, tf.frequency
+            FROM terms t
+            JOIN term_frequency tf ON tf.term_id = t.id
+            WHERE t.term = ? AND tf.document_id IN (SELECT id FROM documents)
+            ORDER BY tf.document_id
+        ''', (term,))
+        document_ids, frequencies = array('q'), array('q')
+        for document_id, frequency in cursor:
+            document_ids.append(document_id)
+            frequencies.append(frequency)
+        return document_ids, frequencies
+    
+    def doc_freq(self, term: str) -> int:
+        """Number of documents containing term."""
+        cursor = self._cursor()
+        cursor.execute('''
+            SELECT s.doc_freq FROM terms t JOIN term_stats s ON s.term_id = t.id
+            WHERE t.term = ?
+        ''', (term,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    
+    def document_stats(self, document_id: int) -> Optional[DocumentStats]:
+        """Statistics of a document, or None if it is not stored."""
+        cursor = self._cursor()
+        cursor.execute('SELECT filename, word_count, pagerank FROM documents WHERE id = ?',
+                       (document_id,))
+        row = cursor.fetchone()
+        return DocumentStats(row[0], row[1] or 0, row[2]) if row else None
+    
+    def collection_stats(self) -> CollectionStats:
+        """Number of documents and words in the collection."""
+        cursor = self._cursor()
+        cursor.execute('''
+            SELECT key, value FROM collection_stats
+            WHERE key IN ('generation', 'total_docs', 'total_words')
+        ''')
+        stats = dict(cursor.fetchall())
+        cursor.execute("SELECT value FROM database_info WHERE key = 'database_id'")
+        return CollectionStats(int(stats.get('total_docs', 0)),
+                               int(stats.get('total_words', 0)), stats.get('generation', 0),
+                               cursor.fetchone()[0])
+    
+    def documents(self) -> Iterator[Tuple[int, DocumentStats]]:
+        """Every document's id and statistics, by ascending id."""
+        cursor = self._cursor()
+        cursor.execute('SELECT id, filename, word_count, pagerank FROM documents ORDER BY id')
+        for document_id, filename, word_count, rank in cursor:
+            yield document_id, DocumentStats(filename, word_count or 0, rank)
+    
+    def terms(self) -> Iterator[str]:
+        """Every term with postings, in sorted order."""
+        cursor = self._cursor()
+        cursor.execute('''
+            SELECT t.term FROM terms t JOIN term_stats s ON s.term_id = t.id
+            WHERE s.doc_freq > 0
+            ORDER BY t.term
+        ''')
+        for (term,) in cursor:
+            yield term
+    
     def init_database(self):
-        """Initialize the SQLite database with required tables."""
-        conn = sqlite3.connect(self.db_path)
+        """Create the database schema, upgrading an existing database in place.
+        
+        Every schema change is a numbered migration recorded in the
+        schema_version table; on open, the migrations newer than the
+        database's version are applied in order, each in its own transaction.
+        """
+        conn = self.connections.connection()
         cursor = conn.cursor()
         
+        # A plain read first: opening an up-to-date database must not wait
+        # for the write lock, which an ingest can hold for a whole batch
+        current = self._schema_version(cursor)
+        self._check_schema_version(current)
+        if current == len(self.SCHEMA_MIGRATIONS):
+            return
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        for version, migration in enumerate(self.SCHEMA_MIGRATIONS, 1):
+            if version <= current:
+                continue
+            # IMMEDIATE takes the write lock up front so two processes
+            # opening the same database cannot apply a migration twice
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                current = self._schema_version(cursor)
+                self._check_schema_version(current)
+                if current < version:
+                    migration(self, cursor)
+                    cursor.execute('INSERT INTO schema_version (version) VALUES (?)', (version,))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+    
+    def _schema_version(self, cursor) -> int:
+        """Return the latest migration applied to the database (0 if none)."""
+        cursor.execute('''
+            SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'
+        ''')
+        if cursor.fetchone() is None:
+            return 0
+        cursor.execute('SELECT MAX(version) FROM schema_version')
+        return cursor.fetchone()[0] or 0
+    
+    def _check_schema_version(self, version: int):
+        """Refuse a database written by a newer version of this module."""
+        if version > len(self.SCHEMA_MIGRATIONS):
+            raise RuntimeError(
+                f"Database {self.db_path} has schema version {version}, "
+                f"newer than the supported version {len(self.SCHEMA_MIGRATIONS)}")
+    
+    def _migrate_base_tables(self, cursor):
+        """Version 1: documents and term_frequency tables."""
         # Create documents table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS documents (
@@ -44,21 +1399,790 @@ class PDFTextAnalyzer:
                 UNIQUE(document_id, term)
             )
         ''')
+    
+    def _migrate_stats_tables(self, cursor):
+        """Version 2: term_stats and collection_stats, backfilled from postings."""
+        # Create document frequency table, maintained on ingest and removal
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS term_stats (
+                term TEXT PRIMARY KEY,
+                doc_freq INTEGER NOT NULL
+            )
+        ''')
+        
+        # Create collection-wide statistics table (e.g. total_docs)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS collection_stats (
+                key TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            )
+        ''')
         
+        # Backfill from existing postings (migrations use their own SQL, as
+        # later versions change the tables the current helpers work on)
+        if self.collection_stat(cursor, 'total_docs') is None:
+            cursor.execute('DELETE FROM term_stats')
+            cursor.execute('''
+                INSERT INTO term_stats (term, doc_freq)
+                SELECT term, COUNT(DISTINCT document_id)
+                FROM term_frequency
+                WHERE document_id IN (SELECT id FROM documents)
+                GROUP BY term
+            ''')
+            cursor.execute('''
+                INSERT OR REPLACE INTO collection_stats (key, value)
+                SELECT 'total_docs', COUNT(*) FROM documents
+            ''')
+    
+    def _migrate_query_indexes(self, cursor):
+        """Version 3: covering indexes for the term and per-document query paths."""
+        # IDF and search walk postings by term and only need document_id and
+        # tf_score, so the index covers them and the table is never touched
+        cursor.execute('DROP INDEX IF EXISTS idx_term_frequency_term')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_term_frequency_term_doc
+            ON term_frequency (term, document_id, tf_score)
+        ''')
+        
+        # get_document_stats lists a document's most frequent terms
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_term_frequency_doc_frequency
+            ON term_frequency (document_id, frequency DESC, term, tf_score)
+        ''')
+    
+    def _migrate_document_manifest(self, cursor):
+        """Version 4: manifest of indexed files for incremental re-indexing."""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS document_manifest (
+                path TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_document_manifest_hash
+            ON document_manifest (content_hash, filename)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_document_manifest_filename
+            ON document_manifest (filename)
+        ''')
+    
+    def _migrate_term_dictionary(self, cursor):
+        """Version 5: terms dictionary; postings and term_stats keyed by term id."""
+        cursor.execute('''
+            CREATE TABLE terms (
+                id INTEGER PRIMARY KEY,
+                term TEXT UNIQUE NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            INSERT INTO terms (term)
+            SELECT DISTINCT term FROM term_frequency WHERE term IS NOT NULL
+        ''')
+        
+        # Postings are keyed by (document, term id); the surrogate row id of
+        # the old table was never referenced
+        cursor.execute('''
+            CREATE TABLE term_frequency_v5 (
+                document_id INTEGER NOT NULL,
+                term_id INTEGER NOT NULL,
+                frequency INTEGER,
+                tf_score REAL,
+                PRIMARY KEY (document_id, term_id),
+                FOREIGN KEY (document_id) REFERENCES documents (id),
+                FOREIGN KEY (term_id) REFERENCES terms (id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            INSERT INTO term_frequency_v5 (document_id, term_id, frequency, tf_score)
+            SELECT tf.document_id, t.id, tf.frequency, tf.tf_score
+            FROM term_frequency tf
+            JOIN terms t ON t.term = tf.term
+        ''')
+        cursor.execute('DROP TABLE term_frequency')
+        cursor.execute('ALTER TABLE term_frequency_v5 RENAME TO term_frequency')
+        cursor.execute('''
+            CREATE INDEX idx_term_frequency_term_doc
+            ON term_frequency (term_id, document_id, tf_score)
+        ''')
+        cursor.execute('''
+            CREATE INDEX idx_term_frequency_doc_frequency
+            ON term_frequency (document_id, frequency DESC, term_id, tf_score)
+        ''')
+        
+        cursor.execute('DROP TABLE term_stats')
+        cursor.execute('''
+            CREATE TABLE term_stats (
+                term_id INTEGER PRIMARY KEY,
+                doc_freq INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            INSERT INTO term_stats (term_id, doc_freq)
+            SELECT term_id, COUNT(DISTINCT document_id)
+            FROM term_frequency
+            WHERE document_id IN (SELECT id FROM documents)
+            GROUP BY term_id
+        ''')
+    
+    def _migrate_max_tf_scores(self, cursor):
+        """Version 6: per-term maximum TF score, the MaxScore upper bound."""
+        cursor.execute('''
+            ALTER TABLE term_stats ADD COLUMN max_tf_score REAL NOT NULL DEFAULT 0
+        ''')
+        cursor.execute('''
+            UPDATE term_stats SET max_tf_score = (
+                SELECT COALESCE(MAX(tf_score), 0) FROM term_frequency
+                WHERE term_frequency.term_id = term_stats.term_id
+            )
+        ''')
+    
+    def _migrate_bm25_stats(self, cursor):
+        """Version 7: total word count for BM25 and frequencies in the term index."""
+        cursor.execute('''
+            INSERT OR REPLACE INTO collection_stats (key, value)
+            SELECT 'total_words', COALESCE(SUM(word_count), 0) FROM documents
+        ''')
+        # BM25 scores from raw frequencies, so the term index carries them
+        # too and both rankings stay covered
+        cursor.execute('DROP INDEX IF EXISTS idx_term_frequency_term_doc')
+        cursor.execute('''
+            CREATE INDEX idx_term_frequency_term_doc
+            ON term_frequency (term_id, document_id, tf_score, frequency)
+        ''')
+    
+    def _migrate_document_links(self, cursor):
+        """Version 8: references between documents and their stored PageRank."""
+        # Targets are kept as file names and resolved when PageRank is
+        # computed, so links to documents indexed later still count
+        cursor.execute('''
+            CREATE TABLE document_links (
+                source_id INTEGER NOT NULL,
+                target_filename TEXT NOT NULL,
+                PRIMARY KEY (source_id, target_filename),
+                FOREIGN KEY (source_id) REFERENCES documents (id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('ALTER TABLE documents ADD COLUMN pagerank REAL')
+    
+    def _migrate_term_positions(self, cursor):
+        """Version 9: optional positional index for phrase and proximity queries."""
+        # Clustered by term so a phrase reads each of its terms' positions
+        # in one range scan
+        cursor.execute('''
+            CREATE TABLE term_positions (
+                term_id INTEGER NOT NULL,
+                document_id INTEGER NOT NULL,
+                positions BLOB NOT NULL,
+                PRIMARY KEY (term_id, document_id)
+            ) WITHOUT ROWID
+        ''')
+    
+    def _migrate_term_deletes(self, cursor):
+        """Version 10: SymSpell deletion index over the vocabulary for spelling correction."""
+        cursor.execute('''
+            CREATE TABLE term_deletes (
+                delete_key TEXT NOT NULL,
+                deletions INTEGER NOT NULL,
+                term_id INTEGER NOT NULL,
+                PRIMARY KEY (delete_key, deletions, term_id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('SELECT id, term FROM terms')
+        self._add_term_deletes(cursor, cursor.fetchall())
+    
+    def _migrate_document_pages(self, cursor):
+        """Version 11: page offsets and per-page term counts for page-level results."""
+        # Character range of every page in documents.content
+        cursor.execute('''
+            CREATE TABLE document_pages (
+                document_id INTEGER NOT NULL,
+                page_number INTEGER NOT NULL,
+                start_offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                PRIMARY KEY (document_id, page_number),
+                FOREIGN KEY (document_id) REFERENCES documents (id)
+            ) WITHOUT ROWID
+        ''')
+        # Clustered by document: pages are only scored for the documents a
+        # search returned
+        cursor.execute('''
+            CREATE TABLE term_pages (
+                document_id INTEGER NOT NULL,
+                term_id INTEGER NOT NULL,
+                pages BLOB NOT NULL,
+                PRIMARY KEY (document_id, term_id)
+            ) WITHOUT ROWID
+        ''')
+    
+    def _migrate_document_content(self, cursor):
+        """Version 12: document text compressed per page in its own table."""
+        # Chunk n holds page n, so a snippet decompresses one page only
+        cursor.execute('''
+            CREATE TABLE document_content (
+                document_id INTEGER NOT NULL,
+                chunk INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (document_id, chunk),
+                FOREIGN KEY (document_id) REFERENCES documents (id)
+            ) WITHOUT ROWID
+        ''')
+        reader = cursor.connection.cursor()
+        reader.execute('SELECT id, content FROM documents')
+        for document_id, content in reader:
+            cursor.execute('''
+                SELECT start_offset, length FROM document_pages
+                WHERE document_id = ? ORDER BY page_number
+            ''', (document_id,))
+            self._store_content(cursor, document_id, content, cursor.fetchall())
+        
+        # documents keeps only the small columns that listing and scoring scan
+        cursor.execute('''
+            CREATE TABLE documents_v12 (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                filename TEXT UNIQUE NOT NULL,
+                word_count INTEGER,
+                pagerank REAL
+            )
+        ''')
+        cursor.execute('''
+            INSERT INTO documents_v12 (id, filename, word_count, pagerank)
+            SELECT id, filename, word_count, pagerank FROM documents
+        ''')
+        # Carry the AUTOINCREMENT counter over so ids of removed documents
+        # are never reused
+        cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'documents_v12'")
+        cursor.execute('''
+            INSERT INTO sqlite_sequence (name, seq)
+            SELECT 'documents_v12', seq FROM sqlite_sequence WHERE name = 'documents'
+        ''')
+        cursor.execute('DROP TABLE documents')
+        cursor.execute('ALTER TABLE documents_v12 RENAME TO documents')
+    
+    def _migrate_document_fts(self, cursor):
+        """Version 13: FTS5 full-text index searched by the fts5 engine."""
+        if not FTS5_AVAILABLE:
+            # The fts5 engine refuses to run on such a build
+            return
+        # Contentless: the text is in document_content already, so only the
+        # inverted index is stored. Documents are deleted with the text
+        # rebuilt from term_frequency (see fts_document()).
+        cursor.execute('''
+            CREATE VIRTUAL TABLE document_fts USING fts5(terms, content='')
+        ''')
+    
+    def _migrate_fts_sync(self, cursor):
+        """Version 14: document_fts kept in sync on write rather than caught up on search."""
+        # Databases already searched with fts5 keep their index, caught up
+        # with the documents written since
+        if FTS5_AVAILABLE and self.collection_stat(cursor, 'fts_docs'):
+            self._fill_fts(cursor)
+        cursor.execute("DELETE FROM collection_stats WHERE key = 'fts_docs'")
+    
+    def _migrate_database_id(self, cursor):
+        """Version 15: database_info, with a random UUID identifying the database."""
+        # Text properties of the database, apart from the numeric
+        # collection_stats. A database rebuilt at the same path can reach
+        # the generation of the old one's segment; the UUID, recorded in
+        # the segment, tells the two apart
+        cursor.execute('''
+            CREATE TABLE database_info (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            INSERT INTO database_info (key, value) VALUES ('database_id', ?)
+        ''', (str(uuid.uuid4()),))
+    
+    def _migrate_link_generation(self, cursor):
+        """Version 16: PageRank tracks the link graph's generation, not the index's."""
+        # The ranks are recomputed once, on the next write that checks them
+        cursor.execute("DELETE FROM collection_stats WHERE key = 'pagerank_generation'")
+    
+    # Ordered schema migrations; the position in the tuple is the version.
+    # Append new steps only, never reorder or edit released ones.
+    SCHEMA_MIGRATIONS = (
+        _migrate_base_tables,
+        _migrate_stats_tables,
+        _migrate_query_indexes,
+        _migrate_document_manifest,
+        _migrate_term_dictionary,
+        _migrate_max_tf_scores,
+        _migrate_bm25_stats,
+        _migrate_document_links,
+        _migrate_term_positions,
+        _migrate_term_deletes,
+        _migrate_document_pages,
+        _migrate_document_content,
+        _migrate_document_fts,
+        _migrate_fts_sync,
+        _migrate_database_id,
+        _migrate_link_generation,
+    )
+    
+    def _store_document(self, cursor, filename: str, content, word_count: int,
+                        term_counts: Dict[str, int], tf_scores: Dict[str, float],
+                        links: Iterable[str] = (),
+                        positions: Optional[Dict[str, List[int]]] = None,
+                        pages: Optional[Tuple[List[Tuple[int, int]],
+                                              Dict[str, List[Tuple[int, int]]]]] = None):
+        """Write a document, its term frequencies and its links using an open cursor.
+        
+        content is the document text, or its compressed chunks as returned
+        by PDFTextAnalyzer._extract_and_count(). pages holds the (start,
+        length) character range of every page in the text and every term's
+        (page number, count) pairs; the text is stored compressed, one chunk
+        per page.
+        Re-ingesting a filename updates its documents row in place, so the
+        document id stays stable, and replaces its text, postings,
+        positions, pages and links in the same transaction. Returns the
+        document's id.
+        """
+        links = {target for target in links if target != filename}
+        cursor.execute('SELECT id, word_count FROM documents WHERE filename = ?', (filename,))
+        existing = cursor.fetchone()
+        if existing:
+            # Drop the postings of the previous version of this document and
+            # take them out of the statistics
+            document_id = existing[0]
+            self.add_collection_stat(cursor, 'total_words', word_count - (existing[1] or 0))
+            self._delete_postings(cursor, document_id)
+            cursor.execute('SELECT target_filename FROM document_links WHERE source_id = ?',
+                           (document_id,))
+            if {target for (target,) in cursor.fetchall()} != links:
+                self.add_collection_stat(cursor, 'links_generation', 1)
+            cursor.execute('DELETE FROM document_links WHERE source_id = ?', (document_id,))
+            cursor.execute('''
+                UPDATE documents SET word_count = ?
+                WHERE id = ?
+            ''', (word_count, document_id))
+        else:
+            # Insert document
+            cursor.execute('''
+                INSERT INTO documents (filename, word_count)
+                VALUES (?, ?)
+            ''', (filename, word_count))
+            document_id = cursor.lastrowid
+            self.add_collection_stat(cursor, 'total_docs', 1)
+            self.add_collection_stat(cursor, 'total_words', word_count)
+            if links or self.is_link_target(cursor, filename):
+                self.add_collection_stat(cursor, 'links_generation', 1)
+        self.add_collection_stat(cursor, 'generation', 1)
+        self._store_content(cursor, document_id, content, pages[0] if pages else [])
+        if self.fts_enabled(cursor):
+            self._add_fts_document(cursor, document_id, term_counts.items())
+        
+        term_ids = self._term_ids_for(cursor, tf_scores)
+        
+        # Insert all term frequencies in one batch
+        cursor.executemany('''
+            INSERT INTO term_frequency (document_id, term_id, frequency, tf_score)
+            VALUES (?, ?, ?, ?)
+        ''', ((document_id, term_ids[term], term_counts[term], tf_score)
+              for term, tf_score in tf_scores.items()))
+        
+        # Every term of the document gains one document; max_tf_score only
+        # grows here, so after removals it stays a valid (if loose) bound
+        # until PDFTextAnalyzer.compact() recomputes it
+        cursor.executemany('''
+            INSERT INTO term_stats (term_id, doc_freq, max_tf_score) VALUES (?, 1, ?)
+            ON CONFLICT (term_id) DO UPDATE SET
+                doc_freq = doc_freq + 1,
+                max_tf_score = MAX(max_tf_score, excluded.max_tf_score)
+        ''', ((term_ids[term], tf_score) for term, tf_score in tf_scores.items()))
+        
+        cursor.executemany('''
+            INSERT OR IGNORE INTO document_links (source_id, target_filename) VALUES (?, ?)
+        ''', ((document_id, target) for target in links))
+        
+        if positions:
+            cursor.executemany('''
+                INSERT INTO term_positions (term_id, document_id, positions) VALUES (?, ?, ?)
+            ''', ((term_ids[term], document_id, encode_positions(term_positions))
+                  for term, term_positions in positions.items()))
+        
+        if pages:
+            page_spans, page_counts = pages
+            cursor.executemany('''
+                INSERT INTO document_pages (document_id, page_number, start_offset, length)
+                VALUES (?, ?, ?, ?)
+            ''', ((document_id, page_number, start, length)
+                  for page_number, (start, length) in enumerate(page_spans, 1)))
+            cursor.executemany('''
+                INSERT INTO term_pages (document_id, term_id, pages) VALUES (?, ?, ?)
+            ''', ((document_id, term_ids[term], encode_page_counts(term_pages))
+                  for term, term_pages in page_counts.items()))
+        return document_id
+    
+    def _store_content(self, cursor, document_id: int, content,
+                       page_spans: List[Tuple[int, int]]):
+        """Write a document's text, or its compressed chunks, to document_content."""
+        if isinstance(content, str):
+            content = map(compress_text, content_chunks(content, page_spans))
+        cursor.executemany('''
+            INSERT INTO document_content (document_id, chunk, data) VALUES (?, ?, ?)
+        ''', ((document_id, chunk, data) for chunk, data in enumerate(content, 1)))
+    
+    def _add_fts_document(self, cursor, document_id: int,
+                          term_counts: Iterable[Tuple[str, int]]):
+        """Index a document's terms in document_fts."""
+        cursor.execute('INSERT INTO document_fts (rowid, terms) VALUES (?, ?)',
+                       (document_id, fts_document(term_counts)))
+    
+    def _delete_fts_document(self, cursor, document_id: int):
+        """Remove a document from document_fts, if it is indexed there.
+        
+        Must run before the document's term_frequency rows are deleted: a
+        contentless FTS5 table needs the indexed text to delete a row.
+        """
+        cursor.execute('SELECT 1 FROM document_fts WHERE rowid = ?', (document_id,))
+        if cursor.fetchone() is None:
+            return
+        cursor.execute('''
+            SELECT t.term, tf.frequency
+            FROM term_frequency tf
+            JOIN terms t ON t.id = tf.term_id
+            WHERE tf.document_id = ?
+        ''', (document_id,))
+        cursor.execute('''
+            INSERT INTO document_fts (document_fts, rowid, terms) VALUES ('delete', ?, ?)
+        ''', (document_id, fts_document(cursor.fetchall())))
+    
+    def fts_enabled(self, cursor) -> bool:
+        """Whether the database keeps document_fts in sync with its documents."""
+        return FTS5_AVAILABLE and bool(self.collection_stat(cursor, 'fts_enabled'))
+    
+    def enable_fts(self):
+        """Index every document in document_fts and keep it in sync from now on.
+        
+        Runs when an analyzer with engine 'fts5' opens the database. Once
+        enabled, every analyzer writing to the database updates document_fts
+        in the same transaction as the rest of the document, so searches
+        never write to it.
+        """
+        conn = self.connections.connection()
+        cursor = conn.cursor()
+        if self.fts_enabled(cursor):
+            return
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            self._fill_fts(cursor)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    
+    def _fill_fts(self, cursor):
+        """Index the documents missing from document_fts and mark it as kept in sync."""
+        reader = cursor.connection.cursor()
+        reader.execute('''
+            SELECT id FROM documents
+            WHERE id NOT IN (SELECT rowid FROM document_fts)
+        ''')
+        for (document_id,) in reader.fetchall():
+            cursor.execute('''
+                SELECT t.term, tf.frequency
+                FROM term_frequency tf
+                JOIN terms t ON t.id = tf.term_id
+                WHERE tf.document_id = ?
+            ''', (document_id,))
+            self._add_fts_document(cursor, document_id, cursor.fetchall())
+        cursor.execute('''
+            INSERT OR REPLACE INTO collection_stats (key, value) VALUES ('fts_enabled', 1)
+        ''')
+    
+    def _term_ids_for(self, cursor, terms: Iterable[str]) -> Dict[str, int]:
+        """Map terms to their ids, adding unknown terms to the terms table."""
+        # compact() may delete unused terms, which invalidates cached ids
+        epoch = self.collection_stat(cursor, 'vocabulary_epoch')
+        staged = self._staged_term_ids_for_thread()
+        # Ids are staged for the epoch this transaction read; _commit only
+        # publishes them if the cache is still at that epoch
+        self._staged_term_ids.epoch = epoch
+        term_ids = {}
+        missing = []
+        with self._term_ids_lock:
+            if epoch != self._vocabulary_epoch:
+                self._term_ids.clear()
+                self._vocabulary_epoch = epoch
+            for term in terms:
+                term_id = self._term_ids.get(term) or staged.get(term)
+                if term_id is None:
+                    missing.append(term)
+                else:
+                    term_ids[term] = term_id
+        
+        if missing:
+            # New terms get ids above the current maximum
+            cursor.execute('SELECT MAX(id) FROM terms')
+            last_id = cursor.fetchone()[0] or 0
+            cursor.executemany('INSERT OR IGNORE INTO terms (term) VALUES (?)',
+                               ((term,) for term in missing))
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                placeholders = ', '.join(['?'] * len(chunk))
+                cursor.execute(f'SELECT term, id FROM terms WHERE term IN ({placeholders})', chunk)
+                for term, term_id in cursor.fetchall():
+                    term_ids[term] = term_id
+                    staged[term] = term_id
+            self._add_term_deletes(cursor, [(term_ids[term], term) for term in missing
+                                            if term_ids[term] > last_id])
+        
+        return term_ids
+    
+    def _add_term_deletes(self, cursor, terms: Iterable[Tuple[int, str]]):
+        """Add (term_id, term) pairs to the SymSpell deletion index."""
+        cursor.executemany('''
+            INSERT OR IGNORE INTO term_deletes (delete_key, deletions, term_id) VALUES (?, ?, ?)
+        ''', ((delete, deletions, term_id) for term_id, term in terms
+              for delete, deletions in term_deletes(term).items()))
+    
+    def _staged_term_ids_for_thread(self) -> Dict[str, int]:
+        """Term ids looked up or created by this thread's open transaction."""
+        staged = getattr(self._staged_term_ids, 'ids', None)
+        if staged is None:
+            staged = self._staged_term_ids.ids = {}
+        return staged
+    
+    def _commit(self, conn: sqlite3.Connection):
+        """Commit and publish the transaction's term ids to the cache."""
         conn.commit()
-        conn.close()
+        staged = self._staged_term_ids_for_thread()
+        with self._term_ids_lock:
+            if getattr(self._staged_term_ids, 'epoch', None) == self._vocabulary_epoch:
+                self._term_ids.update(staged)
+        staged.clear()
+    
+    def _rollback(self, conn: sqlite3.Connection):
+        """Roll back and forget term ids that may no longer exist."""
+        conn.rollback()
+        self._staged_term_ids_for_thread().clear()
+    
+    def _delete_postings(self, cursor, document_id: int):
+        """Delete a document's term frequencies, positions, pages and text and update term_stats."""
+        if self.fts_enabled(cursor):
+            self._delete_fts_document(cursor, document_id)
+        cursor.execute('DELETE FROM document_content WHERE document_id = ?', (document_id,))
+        cursor.execute('DELETE FROM term_pages WHERE document_id = ?', (document_id,))
+        cursor.execute('DELETE FROM document_pages WHERE document_id = ?', (document_id,))
+        # Positions are keyed by term first; the document's terms locate them
+        cursor.execute('''
+            DELETE FROM term_positions
+            WHERE document_id = ?
+              AND term_id IN (SELECT term_id FROM term_frequency WHERE document_id = ?)
+        ''', (document_id, document_id))
+        cursor.execute('''
+            UPDATE term_stats SET doc_freq = doc_freq - 1
+            WHERE term_id IN (SELECT term_id FROM term_frequency WHERE document_id = ?)
+        ''', (document_id,))
+        cursor.execute('''
+            DELETE FROM term_stats
+            WHERE doc_freq <= 0
+              AND term_id IN (SELECT term_id FROM term_frequency WHERE document_id = ?)
+        ''', (document_id,))
+        cursor.execute('DELETE FROM term_frequency WHERE document_id = ?', (document_id,))
+    
+    def collection_stat(self, cursor, key: str) -> Optional[float]:
+        """Read a value from collection_stats, or None if it is not set."""
+        cursor.execute('SELECT value FROM collection_stats WHERE key = ?', (key,))
+        result = cursor.fetchone()
+        return result[0] if result else None
+    
+    def add_collection_stat(self, cursor, key: str, delta: float):
+        """Add delta to a collection_stats value, creating it if needed."""
+        cursor.execute('''
+            INSERT INTO collection_stats (key, value) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = value + excluded.value
+        ''', (key, delta))
+    
+    def rebuild_stats(self, cursor):
+        """Recompute term_stats and collection_stats from scratch."""
+        cursor.execute('DELETE FROM term_stats')
+        cursor.execute('''
+            INSERT INTO term_stats (term_id, doc_freq, max_tf_score)
+            SELECT term_id, COUNT(DISTINCT document_id), MAX(tf_score)
+            FROM term_frequency
+            WHERE document_id IN (SELECT id FROM documents)
+            GROUP BY term_id
+        ''')
+        cursor.execute('''
+            INSERT OR REPLACE INTO collection_stats (key, value)
+            SELECT 'total_docs', COUNT(*) FROM documents
+        ''')
+        cursor.execute('''
+            INSERT OR REPLACE INTO collection_stats (key, value)
+            SELECT 'total_words', COALESCE(SUM(word_count), 0) FROM documents
+        ''')
+    
+    def is_link_target(self, cursor, filename: str) -> bool:
+        """Whether any document links to filename."""
+        cursor.execute('SELECT 1 FROM document_links WHERE target_filename = ? LIMIT 1',
+                       (filename,))
+        return cursor.fetchone() is not None
+
+
+class PDFTextAnalyzer:
+    def __init__(self, db_path: str = "pdf_database.db", cache_size: int = -64000,
+                 mmap_size: int = 256 * 1024 * 1024, cached_statements: int = 256,
+                 engine: Optional[str] = None, ranking: str = 'tfidf', k1: float = 1.2,
+                 b: float = 0.75, result_cache_size: int = 256, pagerank_weight: float = 0.0,
+                 positional: bool = False, max_expansions: int = 64,
+                 max_edit_distance: int = FUZZY_MAX_DISTANCE,
+                 storage: Optional[StorageBackend] = None):
+        """Initialize the PDF analyzer with SQLite database.
+        
+        storage is the backend documents are stored in; by default an
+        SQLiteStorage of the database at db_path, where cache_size follows
+        PRAGMA cache_size (negative values are KiB), mmap_size is in bytes
+        and cached_statements sizes the per-connection prepared-statement
+        cache. With another backend, such as storage.MemoryStorage, the
+        analyzer ingests, removes, lists and searches documents through it
+        with the 'memory' or 'sparse' engine; the features built on SQL
+        (the 'sql', 'fts5' and 'segment' engines, boolean, phrase and
+        wildcard queries, spelling correction, PageRank, page results,
+        directory indexing and compact()) raise io.UnsupportedOperation.
+        
+        engine picks the default search engine, 'sql' for SQLite storage
+        and 'memory' for other backends if not given: 'sql' scores in the database,
+        'fts5' ranks with an SQLite FTS5 full-text index and its built-in
+        bm25(), 'memory' serves searches from an InMemoryIndex, 'sparse'
+        from a SparseIndex (needs NumPy and SciPy) and 'segment' from a
+        SegmentIndex, an mmap'ed segment file shared by all processes.
+        Snapshots are reloaded whenever the index generation changes,
+        including writes made by other processes. An analyzer with 'fts5'
+        builds the database's FTS5 index when it opens it; from then on
+        every analyzer writing to the database keeps that index in sync.
+        
+        ranking picks the default scoring function, 'tfidf' or 'bm25'; k1 and
+        b are the BM25 term frequency saturation and length normalization
+        parameters.
+        
+        result_cache_size bounds the LRU cache of search results (0 turns it
+        off); see cache_info().
+        
+        pagerank_weight, between 0 and 1, blends the documents' stored
+        PageRank over the link graph into search scores (see
+        compute_pagerank()).
+        
+        positional also stores the token positions of every term in the
+        documents this analyzer ingests, which "phrase" and NEAR/n queries
+        need.
+        
+        max_expansions caps how many vocabulary terms a prefix or wildcard
+        query term (learn*, wom?n) expands to; the most frequent are kept.
+        
+        max_edit_distance bounds the spelling corrections searched for query
+        words that are not in the index (0 turns correction off).
+        """
+        self.storage = storage if storage is not None else \
+            SQLiteStorage(db_path, cache_size, mmap_size, cached_statements)
+        # The SQL search, ingestion and maintenance paths need the database
+        self.database = self.storage if isinstance(self.storage, SQLiteStorage) else None
+        self.db_path = self.database.db_path if self.database else None
+        self.connections = self.database.connections if self.database else None
+        self.engine = self._check_engine(engine or ('sql' if self.database else 'memory'))
+        self.ranking = self._check_ranking(ranking)
+        self.k1 = k1
+        self.b = b
+        self.pagerank_weight = self._check_pagerank_weight(pagerank_weight)
+        self.positional = positional
+        self.max_expansions = max_expansions
+        if not 0 <= max_edit_distance <= FUZZY_MAX_DISTANCE:
+            raise ValueError(f"max_edit_distance must be between 0 and {FUZZY_MAX_DISTANCE}, "
+                             f"got {max_edit_distance}")
+        self.max_edit_distance = max_edit_distance
+        self._indexes = {}
+        # Searches holding each index, by id(); a replaced index is closed
+        # when its count drops to zero
+        self._index_users = Counter()
+        self._retired_indexes = {}
+        self._index_lock = threading.Lock()
+        self.result_cache = ResultCache(result_cache_size)
+        if self.engine == 'fts5':
+            self.database.enable_fts()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _check_engine(self, engine: str) -> str:
+        """Validate a search engine name."""
+        if engine not in ('sql', 'fts5') and engine not in INDEX_ENGINES:
+            raise ValueError(f"Unknown search engine '{engine}'; "
+                             f"choose from: sql, fts5, {', '.join(INDEX_ENGINES)}")
+        if engine == 'fts5' and not FTS5_AVAILABLE:
+            raise RuntimeError("The fts5 engine needs an SQLite library built with FTS5")
+        if engine == 'sparse' and np is None:
+            raise ImportError("The sparse engine needs NumPy and SciPy. "
+                              "Install with: pip install numpy scipy")
+        if engine in ('sql', 'fts5', 'segment'):
+            self._require_database(f"The {engine} engine")
+        return engine
+    
+    def _check_ranking(self, ranking: str) -> str:
+        """Validate a ranking function name."""
+        if ranking not in RANKINGS:
+            raise ValueError(f"Unknown ranking '{ranking}'; choose from: {', '.join(RANKINGS)}")
+        return ranking
+    
+    def _check_pagerank_weight(self, pagerank_weight: float) -> float:
+        """Validate a PageRank blending weight."""
+        if not 0 <= pagerank_weight <= 1:
+            raise ValueError(f"pagerank_weight must be between 0 and 1, got {pagerank_weight}")
+        return pagerank_weight
+    
+    def _require_database(self, feature: str):
+        """Refuse a feature built on SQL when the storage is not SQLite."""
+        if self.database is None:
+            raise io.UnsupportedOperation(f"{feature} needs the SQLite storage backend, "
+                                          f"not {type(self.storage).__name__}")
+    
+    def close(self):
+        """Close the analyzer's indexes and its storage."""
+        with self._index_lock:
+            for index in self._indexes.values():
+                self._retire_index(index)
+            self._indexes = {}
+        self.storage.close()
+    
+    def iter_pdf_pages(self, pdf_path: str) -> Iterator[str]:
+        """Yield the text of a PDF file one page at a time."""
+        for page_text, uris in self._iter_pdf_pages_with_links(pdf_path):
+            yield page_text
+    
+    def _iter_pdf_pages_with_links(self, pdf_path: str) -> Iterator[Tuple[str, List[str]]]:
+        """Yield the text and link annotation URIs of a PDF file page by page."""
+        with open(pdf_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            for page in pdf_reader.pages:
+                yield page.extract_text(), self._page_link_uris(page)
+    
+    def _page_link_uris(self, page) -> List[str]:
+        """URIs of the link annotations on a PyPDF2 page."""
+        uris = []
+        annotations = page['/Annots'] if '/Annots' in page else []
+        for annotation in annotations:
+            # Malformed annotations are common and never worth failing on
+            try:
+                annotation = annotation.get_object()
+                action = annotation['/A'] if '/A' in annotation else {}
+                if '/URI' in action:
+                    uris.append(str(action['/URI']))
+            except Exception:
+                continue
+        return uris
     
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """Extract text content from a PDF file."""
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                
-                return text.strip()
+            return "\n".join(self.iter_pdf_pages(pdf_path)).strip()
         except Exception as e:
             print(f"Error extracting text from {pdf_path}: {e}")
             return ""
@@ -69,36 +2193,139 @@ class PDFTextAnalyzer:
         text = text.lower()
         
         # Remove special characters and digits, keep only letters and spaces
-        text = re.sub(r'[^a-zA-Z\s]', '', text)
+        text = NON_LETTERS.sub('', text)
+        
+        # Split into words and remove stop words and short words
+        return [word for word in text.split() if len(word) > 2 and word not in STOP_WORDS]
+    
+    def tokenize_positions(self, text: str, start: int = 0) -> Tuple[List[Tuple[int, str]], int]:
+        """Preprocess text like preprocess_text, keeping each word's token position.
         
-        # Split into words and remove empty strings
-        words = [word.strip() for word in text.split() if word.strip()]
-        # stopwords were generated by AI 
-        # Remove common stop words
-        stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 
-                     'to', 'for', 'of', 'with', 'by', 'is', 'are', 'was', 'were',
-                     'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did',
-                     'will', 'would', 'could', 'should', 'may', 'might', 'must',
-                     'this', 'that', 'these', 'those', 'i', 'you', 'he', 'she',
-                     'it', 'we', 'they', 'me', 'him', 'her', 'us', 'them'}
+        Positions count every token, including stop words and short words,
+        from start on, so a phrase only matches words that really are
+        adjacent. Returns the (position, word) pairs and the next position.
+        """
+        tokens = NON_LETTERS.sub('', text.lower()).split()
+        words = [(start + offset, word) for offset, word in enumerate(tokens)
+                 if len(word) > 2 and word not in STOP_WORDS]
+        return words, start + len(tokens)
+    
+    def count_terms(self, pages: Iterable[str]) -> Tuple[Counter, int]:
+        """Tokenize pages as they arrive and accumulate their term counts.
         
-        words = [word for word in words if word not in stop_words and len(word) > 2]
+        Returns the term counts and the total number of words. Only one page
+        is tokenized at a time, so memory is bounded by the largest page.
+        """
+        term_counts, word_count, page_counts, positions = self.count_page_terms(pages)
+        return term_counts, word_count
+    
+    def count_term_positions(self, pages: Iterable[str]) -> Tuple[Counter, int, Dict[str, List[int]]]:
+        """Like count_terms, also collecting every term's token positions."""
+        term_counts, word_count, page_counts, positions = self.count_page_terms(pages, True)
+        return term_counts, word_count, positions
+    
+    def count_page_terms(self, pages: Iterable[str], positional: bool = False):
+        """Tokenize pages as they arrive, counting terms per document and per page.
         
-        return words
+        Returns the term counts, the total number of words, every term's
+        (page number, count) pairs, pages numbered from 1, and with
+        positional every term's token positions (otherwise None). Only one
+        page is tokenized at a time.
+        """
+        term_counts = Counter()
+        page_counts = defaultdict(list)
+        positions = defaultdict(list) if positional else None
+        word_count = 0
+        next_position = 0
+        for page_number, page_text in enumerate(pages, 1):
+            if positional:
+                words, next_position = self.tokenize_positions(page_text, next_position)
+                for position, word in words:
+                    positions[word].append(position)
+                page_terms = Counter(word for position, word in words)
+            else:
+                page_terms = Counter(self.preprocess_text(page_text))
+            for term, count in page_terms.items():
+                page_counts[term].append((page_number, count))
+            term_counts.update(page_terms)
+            word_count += sum(page_terms.values())
+        return term_counts, word_count, page_counts, positions
     
     def calculate_term_frequency(self, words: List[str]) -> Dict[str, float]:
         """Calculate term frequency (TF) for words."""
-        word_count = Counter(words)
-        total_words = len(words)
-        
+        return self._term_frequency_from_counts(Counter(words), len(words))
+    
+    def _term_frequency_from_counts(self, term_counts: Dict[str, int],
+                                    total_words: int) -> Dict[str, float]:
+        """Calculate term frequency (TF) from precomputed term counts."""
         tf_scores = {}
-        for word, count in word_count.items():
+        for word, count in term_counts.items():
             tf_scores[word] = count / total_words
         
         return tf_scores
     
+    def _extract_and_count(self, pdf_path: str, positional: bool = False):
+        """Stream a PDF page by page into its content, term counts, word count and links.
+        
+        Each page is tokenized and compressed into its stored chunk (see
+        content_chunks()) as it is read, and its text dropped, so only the
+        compressed pages and one page of text are held; the content returned
+        is that list of chunks, empty if no text was extracted. Links are the
+        file names of the PDFs the document references, through link
+        annotations or by mentioning their file name. With positional, the
+        term positions are returned as well (otherwise None). The last item
+        holds the pages: their (start, length) character ranges in the
+        document text and every term's (page number, count) pairs.
+        """
+        chunks: List[bytes] = []
+        page_spans: List[Tuple[int, int]] = []
+        links = set()
+        # The document text is the pages joined by newlines and stripped, so
+        # the last page with text on and any blank pages after it are held
+        # back until a later page shows the end is not stripped from them
+        held: List[str] = []
+        offset = 0
+        
+        def store(page_text, separator):
+            nonlocal offset
+            page_spans.append((offset, len(page_text)))
+            chunks.append(compress_text(page_text + separator))
+            offset += len(page_text) + len(separator)
+        
+        def recorded_pages():
+            for page_text, uris in self._iter_pdf_pages_with_links(pdf_path):
+                links.update(PDF_MENTION.findall(page_text))
+                links.update(filter(None, map(_link_target, uris)))
+                yield page_text
+                if not held:
+                    # Blank pages before the text become empty chunks
+                    page_text = page_text.lstrip()
+                    if not page_text:
+                        store("", "")
+                        continue
+                elif page_text.strip():
+                    for held_text in held:
+                        store(held_text, "\n")
+                    held.clear()
+                held.append(page_text)
+        
+        try:
+            term_counts, word_count, page_counts, positions = self.count_page_terms(
+                recorded_pages(), positional)
+        except Exception as e:
+            print(f"Error extracting text from {pdf_path}: {e}")
+            return [], Counter(), 0, [], None, ([], {})
+        
+        if not held:
+            return [], term_counts, word_count, sorted(links), positions, ([], {})
+        store(held[0].rstrip(), "")
+        for blank in held[1:]:
+            store("", "")
+        
+        return chunks, term_counts, word_count, sorted(links), positions, (page_spans, page_counts)
+    
     def process_pdf(self, pdf_path: str) -> bool:
-        """Process a PDF file and store its content and term frequencies in the database."""
+        """Process a PDF file and store its content and term frequencies in the storage."""
         if not os.path.exists(pdf_path):
             print(f"File {pdf_path} does not exist.")
             return False
@@ -106,136 +2333,1615 @@ class PDFTextAnalyzer:
         filename = os.path.basename(pdf_path)
         print(f"Processing {filename}...")
         
-        # Extract text
-        text = self.extract_text_from_pdf(pdf_path)
-        if not text:
+        # Extract, tokenize and compress the text page by page
+        content, term_counts, word_count, links, positions, pages = self._extract_and_count(
+            pdf_path, self.positional)
+        if not content:
             print(f"No text extracted from {filename}")
             return False
         
-        # Preprocess text
-        words = self.preprocess_text(text)
-        if not words:
+        if not word_count:
             print(f"No valid words found in {filename}")
             return False
         
-        # Calculate term frequencies
-        tf_scores = self.calculate_term_frequency(words)
+        try:
+            self.storage.add_document(filename, term_counts, word_count, content, links,
+                                      positions, pages)
+            print(f"Successfully processed {filename} with {len(term_counts)} unique terms")
+            return True
+            
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return False
+    
+    def _document_text(self, cursor, document_id: int, limit: Optional[int] = None) -> str:
+        """Read a document's stored text, or only its first limit characters.
+        
+        Chunks are decompressed in order until limit characters are read.
+        """
+        reader = cursor.connection.cursor()
+        reader.execute('''
+            SELECT data FROM document_content WHERE document_id = ? ORDER BY chunk
+        ''', (document_id,))
+        parts = []
+        remaining = limit
+        for (data,) in reader:
+            part = decompress_text(data, remaining)
+            parts.append(part)
+            if remaining is not None:
+                remaining -= len(part)
+                if remaining <= 0:
+                    break
+        return ''.join(parts)
+    
+    def _page_text(self, cursor, document_id: int, page: int) -> Optional[str]:
+        """Read one page of a document's stored text by decompressing its chunk only."""
+        cursor.execute('''
+            SELECT c.data, p.length
+            FROM document_pages p
+            JOIN document_content c ON c.document_id = p.document_id AND c.chunk = p.page_number
+            WHERE p.document_id = ? AND p.page_number = ?
+        ''', (document_id, page))
+        row = cursor.fetchone()
+        return decompress_text(row[0], row[1]) if row else None
+    
+    def _check_fts(self, cursor) -> bool:
+        """Whether the fts5 engine can search the database, printing why not."""
+        if self.database.fts_enabled(cursor):
+            return True
+        print("The database has no FTS5 index yet; open it once with "
+              "PDFTextAnalyzer(..., engine='fts5') to build it")
+        return False
+    
+    def remove_document(self, filename: str) -> bool:
+        """Remove a document and its term frequencies from the storage."""
+        try:
+            if not self.storage.remove_document(filename):
+                print(f"Document '{filename}' not found in database")
+                return False
+            print(f"Removed {filename}")
+            return True
+            
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return False
+    
+    def process_pdfs(self, pdf_paths: Iterable[str], workers: Optional[int] = None,
+                     batch_size: int = 50) -> List[IngestStatus]:
+        """Process many PDF files in parallel.
+        
+        Extraction, tokenization and term frequency calculation run in a
+        process pool; this process acts as the single database writer and
+        stores results in batches of ``batch_size`` documents, each written
+        in one short transaction once the whole batch has been extracted.
+        Returns one IngestStatus per input path, in input order. Paths whose
+        file name an earlier path already has are reported as failed.
+        """
+        pdf_paths = list(pdf_paths)
+        statuses: List[Optional[IngestStatus]] = [None] * len(pdf_paths)
+        # Documents are keyed by file name, so only the first of several
+        # paths with the same name is indexed; otherwise the one written
+        # last, in completion order, would win
+        submitted = {}
+        
+        # Worker results wait here until a batch is full, so the write
+        # lock is held only while a batch is stored, never while waiting
+        # for extraction
+        batch = []
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for index, pdf_path in enumerate(pdf_paths):
+                filename = os.path.basename(pdf_path)
+                if not os.path.exists(pdf_path):
+                    statuses[index] = IngestStatus(pdf_path, filename, False,
+                                                   error="File does not exist")
+                    continue
+                if filename in submitted:
+                    statuses[index] = IngestStatus(
+                        pdf_path, filename, False,
+                        error=f"Duplicate file name: {submitted[filename]} is indexed "
+                              f"as {filename}")
+                    continue
+                submitted[filename] = pdf_path
+                future = executor.submit(_analyze_pdf, type(self), pdf_path, self.positional)
+                futures[future] = index
+            
+            for future in as_completed(futures):
+                index = futures[future]
+                pdf_path = pdf_paths[index]
+                
+                try:
+                    result, error = future.result()
+                except Exception as e:
+                    result, error = None, str(e)
+                if result is None:
+                    statuses[index] = IngestStatus(pdf_path, os.path.basename(pdf_path), False,
+                                                   error=error)
+                    continue
+                
+                batch.append((index, result))
+                if len(batch) >= batch_size:
+                    self._store_batch(pdf_paths, batch, statuses)
+                    batch = []
+        
+        self._store_batch(pdf_paths, batch, statuses)
+        if self.database:
+            self._ensure_pagerank(self.connections.connection().cursor())
+        return statuses
+    
+    def _store_batch(self, pdf_paths: List[str], batch: List[tuple],
+                     statuses: List[Optional[IngestStatus]]):
+        """Store a batch of process_pdfs worker results in one write transaction."""
+        if not batch:
+            return
+        with self.storage.transaction():
+            for index, result in batch:
+                pdf_path = pdf_paths[index]
+                filename = os.path.basename(pdf_path)
+                content, word_count, term_counts, links, positions, pages = result
+                # A failed document is rolled back alone, keeping the rest
+                # of the batch
+                try:
+                    self.storage.add_document(filename, term_counts, word_count, content,
+                                              links, positions, pages)
+                except sqlite3.Error as e:
+                    statuses[index] = IngestStatus(pdf_path, filename, False,
+                                                   error=f"Database error: {e}")
+                    continue
+                statuses[index] = IngestStatus(pdf_path, filename, True,
+                                               unique_terms=len(term_counts))
+    
+    def compact(self):
+        """Purge orphaned rows, rebuild statistics and reclaim disk space.
         
-        # Store in database
-        conn = sqlite3.connect(self.db_path)
+        Removes term_frequency rows left behind by documents that no longer
+        exist (older versions re-inserted documents under new ids without
+        deleting their postings) and position, page, content, manifest and
+        link rows without a document, then recomputes term_stats and
+        collection_stats, drops terms no document uses, merges the FTS5
+        index, recomputes PageRank and runs VACUUM and ANALYZE.
+        """
+        self._require_database("compact()")
+        conn = self.connections.connection()
         cursor = conn.cursor()
+        size_before = self._database_size()
         
         try:
-            # Insert document
             cursor.execute('''
-                INSERT OR REPLACE INTO documents (filename, content, word_count)
-                VALUES (?, ?, ?)
-            ''', (filename, text, len(words)))
-            
-            document_id = cursor.lastrowid
-            
-            # Delete existing term frequencies for this document
-            cursor.execute('DELETE FROM term_frequency WHERE document_id = ?', (document_id,))
+                DELETE FROM term_frequency
+                WHERE document_id NOT IN (SELECT id FROM documents)
+            ''')
+            orphans = cursor.rowcount
+            cursor.execute('''
+                DELETE FROM document_manifest
+                WHERE filename NOT IN (SELECT filename FROM documents)
+            ''')
+            cursor.execute('''
+                DELETE FROM document_links
+                WHERE source_id NOT IN (SELECT id FROM documents)
+            ''')
+            cursor.execute('''
+                DELETE FROM term_positions
+                WHERE document_id NOT IN (SELECT id FROM documents)
+            ''')
+            cursor.execute('''
+                DELETE FROM term_pages
+                WHERE document_id NOT IN (SELECT id FROM documents)
+            ''')
+            cursor.execute('''
+                DELETE FROM document_pages
+                WHERE document_id NOT IN (SELECT id FROM documents)
+            ''')
+            cursor.execute('''
+                DELETE FROM document_content
+                WHERE document_id NOT IN (SELECT id FROM documents)
+            ''')
+            self.database.rebuild_stats(cursor)
+            # Unused terms are dropped; bumping the epoch tells every
+            # analyzer to discard its cached term ids
+            cursor.execute('DELETE FROM terms WHERE id NOT IN (SELECT term_id FROM term_stats)')
+            cursor.execute('DELETE FROM term_deletes WHERE term_id NOT IN (SELECT id FROM terms)')
+            if self.database.fts_enabled(cursor):
+                # Merge the full-text index's segments into one b-tree
+                cursor.execute("INSERT INTO document_fts (document_fts) VALUES ('optimize')")
+            self.database.add_collection_stat(cursor, 'vocabulary_epoch', 1)
+            self.database.add_collection_stat(cursor, 'generation', 1)
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            conn.rollback()
+            return False
+        self.compute_pagerank()
+        
+        # VACUUM cannot run inside a transaction; the checkpoint folds the
+        # WAL back into the database file so the space is actually released
+        cursor.execute('VACUUM')
+        cursor.execute('ANALYZE')
+        cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        
+        size_after = self._database_size()
+        print(f"Removed {orphans} orphaned term rows; "
+              f"database size {size_before} -> {size_after} bytes")
+        return True
+    
+    def _database_size(self) -> int:
+        """Size in bytes of the database file plus its write-ahead log."""
+        return sum(os.path.getsize(path) for path in (self.db_path, self.db_path + '-wal')
+                   if os.path.exists(path))
+    
+    def index_directory(self, root: str, workers: Optional[int] = None,
+                        prune: bool = False) -> List[IngestStatus]:
+        """Incrementally index every PDF file below a directory.
+        
+        Files whose size and mtime match the manifest are skipped without
+        being read. Changed or new files are hashed, and only those whose
+        content differs from what was indexed are extracted again (through
+        process_pdfs). With prune, documents whose files disappeared from
+        root are removed. Returns one IngestStatus per file found; unchanged
+        files are reported with skipped=True.
+        
+        Documents are keyed by file name, so of several files with the same
+        name in different directories, the one already indexed (or else the
+        first found) is indexed under it; copies with the same content are
+        treated as unchanged, and files with other content are reported as
+        failed instead of replacing its document.
+        """
+        self._require_database("index_directory()")
+        root = os.path.abspath(root)
+        conn = self.connections.connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT path, size, mtime_ns, content_hash FROM document_manifest')
+        manifest = {path: (size, mtime_ns, content_hash)
+                    for path, size, mtime_ns, content_hash in cursor.fetchall()}
+        
+        statuses: List[IngestStatus] = []
+        files = []
+        found = set()
+        
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if not name.lower().endswith('.pdf'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError as e:
+                    statuses.append(IngestStatus(path, name, False, error=str(e)))
+                    continue
+                found.add(path)
+                
+                recorded = manifest.get(path)
+                if recorded and recorded[:2] == (stat.st_size, stat.st_mtime_ns):
+                    files.append((path, name, stat, recorded[2], True))
+                    continue
+                
+                # Size or mtime changed (or the path is new): compare content
+                try:
+                    content_hash = self._hash_file(path)
+                except OSError as e:
+                    statuses.append(IngestStatus(path, name, False, error=str(e)))
+                    continue
+                files.append((path, name, stat, content_hash, False))
+        
+        # The file that owns each name: the first one already indexed, or
+        # else the first one found
+        owners = {}
+        for path, name, stat, content_hash, current in files:
+            if path in manifest:
+                owners.setdefault(name, (path, content_hash))
+        for path, name, stat, content_hash, current in files:
+            owners.setdefault(name, (path, content_hash))
+        
+        manifest_updates = []
+        candidates = []
+        # Copies of each candidate's file, recorded if it is indexed
+        copies = {}
+        
+        for path, name, stat, content_hash, current in files:
+            owner, owner_hash = owners[name]
+            if content_hash != owner_hash:
+                statuses.append(IngestStatus(
+                    path, name, False,
+                    error=f"Duplicate file name: {owner} is indexed as {name}"))
+                continue
+            if current:
+                statuses.append(IngestStatus(path, name, True, skipped=True))
+                continue
             
-            # Insert term frequencies
-            for term, tf_score in tf_scores.items():
-                frequency = Counter(words)[term]
+            entry = (path, name, stat.st_size, stat.st_mtime_ns, content_hash)
+            recorded = manifest.get(path)
+            if recorded and recorded[2] == content_hash:
+                unchanged = True
+            else:
+                # Identical content already indexed under this filename,
+                # e.g. a file that was moved or copied
                 cursor.execute('''
-                    INSERT INTO term_frequency (document_id, term, frequency, tf_score)
-                    VALUES (?, ?, ?, ?)
-                ''', (document_id, term, frequency, tf_score))
+                    SELECT 1 FROM document_manifest
+                    WHERE content_hash = ? AND filename = ?
+                ''', (content_hash, name))
+                unchanged = cursor.fetchone() is not None
             
+            if unchanged:
+                manifest_updates.append(entry)
+                statuses.append(IngestStatus(path, name, True, skipped=True))
+            elif name in copies:
+                copies[name].append(entry)
+            else:
+                copies[name] = []
+                candidates.append(entry)
+        
+        if manifest_updates:
+            self._record_manifest(cursor, manifest_updates)
             conn.commit()
-            print(f"Successfully processed {filename} with {len(tf_scores)} unique terms")
-            return True
+        
+        if candidates:
+            results = self.process_pdfs([entry[0] for entry in candidates], workers=workers)
+            indexed = []
+            for entry, status in zip(candidates, results):
+                if status.success:
+                    indexed.append(entry)
+                    indexed.extend(copies[entry[1]])
+                statuses.extend(IngestStatus(copy[0], copy[1], status.success,
+                                             error=status.error, skipped=status.success)
+                                for copy in copies[entry[1]])
+            self._record_manifest(cursor, indexed)
+            conn.commit()
+            statuses.extend(results)
+        
+        if prune:
+            root_prefix = os.path.join(root, '')
+            for path in manifest:
+                if path.startswith(root_prefix) and path not in found:
+                    self._forget_path(cursor, path)
+                    conn.commit()
+            self._ensure_pagerank(cursor)
+        
+        indexed = sum(1 for status in statuses if status.success and not status.skipped)
+        skipped = sum(1 for status in statuses if status.skipped)
+        failed = sum(1 for status in statuses if not status.success)
+        print(f"Indexed {indexed}, unchanged {skipped}, failed {failed} under {root}")
+        return statuses
+    
+    def _hash_file(self, path: str) -> str:
+        """Return the SHA-256 hex digest of a file, read in chunks."""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def _record_manifest(self, cursor, entries):
+        """Insert or update manifest rows of (path, filename, size, mtime_ns, hash)."""
+        cursor.executemany('''
+            INSERT OR REPLACE INTO document_manifest
+                (path, filename, size, mtime_ns, content_hash)
+            VALUES (?, ?, ?, ?, ?)
+        ''', entries)
+    
+    def _forget_path(self, cursor, path: str):
+        """Drop a vanished file from the manifest, and its document if no other path has it."""
+        cursor.execute('SELECT filename FROM document_manifest WHERE path = ?', (path,))
+        result = cursor.fetchone()
+        if not result:
+            return
+        filename = result[0]
+        cursor.execute('DELETE FROM document_manifest WHERE path = ?', (path,))
+        cursor.execute('SELECT 1 FROM document_manifest WHERE filename = ?', (filename,))
+        if cursor.fetchone() is None:
+            self.remove_document(filename)
+    
+    def compute_pagerank(self, damping: float = 0.85, tolerance: float = 1e-6,
+                         max_iterations: int = 100) -> bool:
+        """Compute the PageRank of every document over the link graph and store it.
+        
+        Links are resolved to indexed documents by file name at this point,
+        so references to documents indexed later count once they exist. The
+        stored ranks warm-start the power iteration, so recomputing after a
+        few documents changed converges in a few iterations.
+        
+        Only ranks that moved are written, and the index generation changes
+        only if one did. process_pdfs and index_directory recompute the
+        ranks when they finish if they changed the link graph, and compact()
+        always does; after process_pdf or remove_document they stay as they
+        were until this is called. Documents added without changing the
+        graph have no rank until then and count as average in searches,
+        which only read the stored ranks.
+        """
+        self._require_database("compute_pagerank()")
+        conn = self.connections.connection()
+        cursor = conn.cursor()
+        
+        try:
+            # Hold the write lock so the graph cannot change underneath
+            if not conn.in_transaction:
+                cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('SELECT id, pagerank FROM documents ORDER BY id')
+            rows = cursor.fetchall()
+            positions = {doc_id: position for position, (doc_id, rank) in enumerate(rows)}
             
+            cursor.execute('''
+                SELECT l.source_id, d.id
+                FROM document_links l
+                JOIN documents d ON d.filename = l.target_filename
+                WHERE d.id != l.source_id
+            ''')
+            sources, targets = [], []
+            for source_id, target_id in cursor:
+                if source_id in positions:
+                    sources.append(positions[source_id])
+                    targets.append(positions[target_id])
+            
+            ranks, iterations = pagerank(sources, targets, len(rows), damping, tolerance,
+                                         max_iterations, [rank for doc_id, rank in rows])
+            # Changes below the convergence tolerance are noise of the warm
+            # start, not a change of the graph
+            changed = [(rank, doc_id) for rank, (doc_id, stored) in zip(ranks, rows)
+                       if stored is None or abs(rank - stored) > tolerance / len(rows)]
+            cursor.executemany('UPDATE documents SET pagerank = ? WHERE id = ?', changed)
+            if changed:
+                # Ranks change blended scores, so this is a new index generation
+                self.database.add_collection_stat(cursor, 'generation', 1)
+            # Recording the link graph's generation marks the ranks as current
+            cursor.execute('''
+                INSERT OR REPLACE INTO collection_stats (key, value)
+                SELECT 'pagerank_links_generation', COALESCE(
+                    (SELECT value FROM collection_stats WHERE key = 'links_generation'), 0)
+            ''')
+            conn.commit()
         except sqlite3.Error as e:
             print(f"Database error: {e}")
             conn.rollback()
             return False
-        finally:
-            conn.close()
+        
+        print(f"PageRank of {len(rows)} documents over {len(sources)} links "
+              f"computed in {iterations} iterations, {len(changed)} ranks changed")
+        return True
+    
+    def _ensure_pagerank(self, cursor):
+        """Recompute PageRank if the link graph changed since it was last computed.
+        
+        Only called at the end of write operations. Writes that add, change
+        or remove a resolved link bump the 'links_generation' stat; other
+        writes leave the ranks alone.
+        """
+        links_generation = self.database.collection_stat(cursor, 'links_generation') or 0
+        if self.database.collection_stat(cursor, 'pagerank_links_generation') != links_generation:
+            self.compute_pagerank()
     
     def calculate_idf(self) -> Dict[str, float]:
         """Calculate Inverse Document Frequency (IDF) for all terms."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        if self.database is None:
+            total_docs = self.storage.collection_stats().total_docs
+            if total_docs == 0:
+                return {}
+            return {term: math.log(total_docs / self.storage.doc_freq(term))
+                    for term in self.storage.terms()}
+        cursor = self.connections.connection().cursor()
+        return self._idf_scores(cursor)
+    
+    def _idf_scores(self, cursor, terms: Optional[Iterable[str]] = None) -> Dict[str, float]:
+        """Read IDF scores from term_stats, for all terms or only the given ones."""
         # Get total number of documents
-        cursor.execute('SELECT COUNT(*) FROM documents')
-        total_docs = cursor.fetchone()[0]
+        total_docs = self.database.collection_stat(cursor, 'total_docs') or 0
         
         if total_docs == 0:
             return {}
         
-        # Get document frequency for each term
-        cursor.execute('''
-            SELECT term, COUNT(DISTINCT document_id) as doc_freq
-            FROM term_frequency
-            GROUP BY term
-        ''')
-        
         idf_scores = {}
-        for term, doc_freq in cursor.fetchall():
+        for term, (term_id, doc_freq) in self._term_stats(cursor, terms).items():
             idf_scores[term] = math.log(total_docs / doc_freq)
         
-        conn.close()
         return idf_scores
     
-    def search(self, query: str, top_n: int = 10) -> List[Tuple[str, float]]:
-        """Search for documents most relevant to the query using TF-IDF scoring."""
-        # Preprocess query
-        query_words = self.preprocess_text(query)
-        if not query_words:
+    def _term_stats(self, cursor, terms: Optional[Iterable[str]] = None) -> Dict[str, Tuple[int, int]]:
+        """Map terms to (term_id, doc_freq), for all terms or only the given ones."""
+        # Get document frequency for each term
+        term_stats = {}
+        for where, params in _in_clause_filters('t.term', terms):
+            cursor.execute(f'''
+                SELECT t.term, s.term_id, s.doc_freq
+                FROM terms t
+                JOIN term_stats s ON s.term_id = t.id
+                {where}
+            ''', params)
+            for term, term_id, doc_freq in cursor.fetchall():
+                term_stats[term] = (term_id, doc_freq)
+        
+        return term_stats
+    
+    def search(self, query: str, top_n: int = 10, engine: Optional[str] = None,
+               ranking: Optional[str] = None, k1: Optional[float] = None,
+               b: Optional[float] = None,
+               pagerank_weight: Optional[float] = None) -> List[Tuple[str, float]]:
+        """Search for documents most relevant to the query.
+        
+        Documents are scored with TF-IDF or BM25, optionally blended with
+        their PageRank; engine, ranking, k1, b and pagerank_weight override
+        the analyzer's defaults for this call.
+        
+        With a positional index, "quoted phrases" only match documents
+        containing the exact phrase and ``word NEAR/n word`` only documents
+        where the two words occur with at most n tokens between them.
+        
+        Queries using AND, OR, NOT, parentheses or +required/-excluded
+        clauses are boolean queries (see _parse_boolean_query), matched over
+        sorted posting lists and ranked by their non-excluded words. Phrase,
+        NEAR and boolean queries are scored in SQLite over the matching
+        documents.
+        
+        Terms ending in or containing * (any letters), or containing ? (one
+        letter) followed by a letter, like learn* or wom?n, match the
+        vocabulary terms that fit the pattern, up to max_expansions of them. Words that are not in the index are
+        replaced by their closest spelling corrections (see suggest()).
+        
+        Without SQLite storage only plain word queries can be searched, and
+        words are not corrected.
+        """
+        engine, ranking, k1, b, pagerank_weight = self._search_options(
+            engine, ranking, k1, b, pagerank_weight)
+        if self.database is None:
+            return self._search_storage(query, top_n, engine, ranking, k1, b, pagerank_weight)
+        conn = self.connections.connection()
+        parsed = self._parse_query(conn.cursor(), query)
+        if parsed is None:
+            return []
+        return self._search_parsed(conn, parsed, top_n, engine, ranking, k1, b, pagerank_weight)
+    
+    def _search_storage(self, query: str, top_n: int, engine: str, ranking: str, k1: float,
+                        b: float, pagerank_weight: float) -> List[Tuple[str, float]]:
+        """Rank the documents of a storage other than SQLite for a plain word query."""
+        # Their query syntax is matched and expanded in SQL
+        if BOOLEAN_SYNTAX.search(query) or PHRASE.search(query) or \
+                NEAR_OPERATOR.search(query) or WILDCARD_TERM.search(query):
+            self._require_database("Boolean, phrase, NEAR and wildcard queries")
+        query_counts = Counter(self.preprocess_text(query))
+        if not query_counts:
             print("No valid search terms found in query")
             return []
         
-        # Calculate IDF scores
-        idf_scores = self.calculate_idf()
+        cache_key = (tuple(sorted(query_counts.items())), top_n, engine, ranking, k1, b,
+                     pagerank_weight)
+        index = self._current_index(None, engine)
+        try:
+            results = self.result_cache.get(cache_key, index.generation)
+            if results is None:
+                results = index.search(query_counts, top_n, ranking, k1, b, pagerank_weight)
+                self.result_cache.put(cache_key, index.generation, results)
+        finally:
+            self._release_index(index)
+        return results
+    
+    def _parse_query(self, cursor, query: str):
+        """Parse a query for search, or return None if it has no search terms.
+        
+        Returns the boolean query tree (None for other queries), the phrases,
+        the NEAR constraints and the weighted query terms, with wildcards
+        expanded and misspelled words corrected.
+        """
+        tree = None
+        if BOOLEAN_SYNTAX.search(query):
+            tree, query_words = self._parse_boolean_query(query, cursor)
+            phrases = proximities = ()
+        else:
+            text, expansions = self._expand_wildcards(cursor, query)
+            phrases, proximities, text = self._parse_positional_query(text)
+            query_words = self.preprocess_text(text) + expansions
+        if not query_words:
+            print("No valid search terms found in query")
+            return None
+        
+        query_counts = Counter(query_words)
+        corrections = self._corrections(cursor, query_counts)
+        if corrections:
+            query_counts = self._corrected_counts(query_counts, corrections)
+            if tree is not None:
+                self._correct_tree(tree, corrections)
+        return tree, phrases, proximities, query_counts
+    
+    def _search_parsed(self, conn: sqlite3.Connection, parsed, top_n: int, engine: str,
+                       ranking: str, k1: float, b: float,
+                       pagerank_weight: float) -> List[Tuple[str, float]]:
+        """Rank the documents for a query parsed by _parse_query."""
+        tree, phrases, proximities, query_counts = parsed
+        cursor = conn.cursor()
+        if engine == 'fts5':
+            if not self._check_fts(cursor):
+                return []
+            # FTS5 always ranks with its own bm25()
+            ranking = 'fts5'
+        
+        # Results depend only on the query's terms, the engine, the scoring
+        # mode and the index generation, which every write bumps
+        cache_key = (tuple(sorted(query_counts.items())), repr(tree), phrases, proximities,
+                     top_n, engine, ranking, k1, b, pagerank_weight)
+        generation = self.database.collection_stat(cursor, 'generation') or 0
+        results = self.result_cache.get(cache_key, generation)
+        if results is not None:
+            return results
+        
+        documents = None
+        if tree is not None:
+            # The memory engine's snapshot already holds every posting list
+            if engine == 'memory':
+                index = self._current_index(conn, engine)
+                try:
+                    documents = self._boolean_matches(cursor, tree, index)
+                finally:
+                    self._release_index(index)
+            else:
+                documents = self._boolean_matches(cursor, tree, None)
+        elif phrases or proximities:
+            cursor.execute('SELECT 1 FROM term_positions LIMIT 1')
+            if cursor.fetchone() is None:
+                print("Phrase and NEAR queries need a positional index; index documents "
+                      "with PDFTextAnalyzer(..., positional=True). Searching the words instead.")
+            else:
+                documents = self._positional_matches(cursor, phrases, proximities)
+        
+        if documents is not None and not documents:
+            results = []
+        elif engine == 'fts5':
+            results = self._score_fts5(cursor, query_counts, top_n, pagerank_weight, documents)
+        elif engine != 'sql' and documents is None:
+            index = self._current_index(conn, engine)
+            try:
+                results = index.search(query_counts, top_n, ranking, k1, b, pagerank_weight)
+            finally:
+                self._release_index(index)
+            generation = index.generation
+        else:
+            # Look up IDF scores of the query terms only
+            total_docs = self.database.collection_stat(cursor, 'total_docs') or 0
+            total_words = self.database.collection_stat(cursor, 'total_words') or 0
+            term_stats = self._term_stats(cursor, query_counts)
+            results = self._score_sql(cursor, query_counts, term_stats, total_docs,
+                                      total_words, top_n, ranking, k1, b, pagerank_weight,
+                                      documents)
+        
+        self.result_cache.put(cache_key, generation, results)
+        return results
+    
+    def search_detailed(self, query: str, top_n: int = 10, pages: int = 3,
+                        snippet_length: int = 200, engine: Optional[str] = None,
+                        ranking: Optional[str] = None, k1: Optional[float] = None,
+                        b: Optional[float] = None,
+                        pagerank_weight: Optional[float] = None) -> List[SearchResult]:
+        """Search like search(), adding the best-matching pages of every result.
         
-        # Calculate TF-IDF scores for each document
-        conn = sqlite3.connect(self.db_path)
+        Pages are scored with the per-page term counts stored at ingestion,
+        weighting each query term by its IDF, and each of the best ``pages``
+        pages gets a snippet of about snippet_length characters around its
+        first query term, with the query terms marked by HIGHLIGHT_MARKERS.
+        Only those pages are read, decompressing one stored chunk each.
+        Documents indexed before page data was stored have no pages.
+        """
+        self._require_database("search_detailed()")
+        options = self._search_options(engine, ranking, k1, b, pagerank_weight)
+        conn = self.connections.connection()
         cursor = conn.cursor()
+        parsed = self._parse_query(cursor, query)
+        if parsed is None:
+            return []
+        results = self._search_parsed(conn, parsed, top_n, *options)
+        if not results:
+            return []
+        
+        query_counts = parsed[3]
+        total_docs = self.database.collection_stat(cursor, 'total_docs') or 0
+        term_weights = {term_id: query_counts[term] * bm25_idf(total_docs, doc_freq)
+                        for term, (term_id, doc_freq)
+                        in self._term_stats(cursor, query_counts).items()}
+        highlight = re.compile(r'\b(?:' + '|'.join(sorted(query_counts, key=len, reverse=True))
+                               + r')\b', re.IGNORECASE)
+        cursor.execute('''
+            SELECT filename, id FROM documents
+            WHERE filename IN (SELECT value FROM json_each(?))
+        ''', (json.dumps([filename for filename, score in results]),))
+        document_ids = dict(cursor.fetchall())
+        
+        detailed = []
+        for filename, score in results:
+            document_id = document_ids.get(filename)
+            page_matches = []
+            if document_id is not None and term_weights:
+                page_matches = self._best_pages(cursor, document_id, term_weights, pages,
+                                                highlight, snippet_length)
+            detailed.append(SearchResult(filename, score, page_matches))
+        return detailed
+    
+    def _best_pages(self, cursor, document_id: int, term_weights: Dict[int, float],
+                    pages: int, highlight, snippet_length: int) -> List[PageMatch]:
+        """Score a document's pages for weighted query terms and cut snippets of the best."""
+        cursor.execute('''
+            SELECT term_id, pages FROM term_pages
+            WHERE document_id = ? AND term_id IN (SELECT value FROM json_each(?))
+        ''', (document_id, json.dumps(list(term_weights))))
+        page_scores = defaultdict(float)
+        for term_id, blob in cursor.fetchall():
+            for page, count in decode_page_counts(blob):
+                page_scores[page] += count * term_weights[term_id]
+        best = heapq.nsmallest(pages, page_scores.items(), key=lambda item: (-item[1], item[0]))
         
-        # Get all documents
-        cursor.execute('SELECT id, filename FROM documents')
-        documents = cursor.fetchall()
+        page_matches = []
+        for page, page_score in best:
+            page_text = self._page_text(cursor, document_id, page)
+            snippet = self._snippet(page_text, highlight, snippet_length) if page_text else ""
+            page_matches.append(PageMatch(page, page_score, snippet))
+        return page_matches
+    
+    def _snippet(self, page_text: str, highlight, snippet_length: int) -> str:
+        """Cut about snippet_length characters around the first highlighted term."""
+        text = ' '.join(page_text.split())
+        match = highlight.search(text)
+        start = 0
+        if match:
+            # Show some context before the hit, starting at a word boundary
+            start = max(0, match.start() - snippet_length // 3)
+            space = text.find(' ', start, match.start())
+            if start and space >= 0:
+                start = space + 1
+        end = start + snippet_length
+        if end < len(text):
+            space = text.rfind(' ', start, end)
+            if space > start:
+                end = space
+        opening, closing = HIGHLIGHT_MARKERS
+        snippet = highlight.sub(lambda hit: f"{opening}{hit.group()}{closing}", text[start:end])
+        return ("..." if start else "") + snippet + ("..." if end < len(text) else "")
+    
+    def cache_info(self) -> CacheInfo:
+        """Hit/miss counters and size of the search result cache."""
+        return self.result_cache.info()
+    
+    def _score_sql(self, cursor, query_counts: Dict[str, int],
+                   term_stats: Dict[str, Tuple[int, int]], total_docs: float,
+                   total_words: float, top_n: int, ranking: str, k1: float,
+                   b: float, pagerank_weight: float = 0.0,
+                   documents: Optional[Iterable[int]] = None) -> List[Tuple[str, float]]:
+        """Score a query inside SQLite given the statistics of its terms.
         
-        doc_scores = {}
+        documents restricts the results to the given document ids.
+        """
+        # Weight each distinct query term by its IDF and how often it was
+        # repeated; terms that cannot contribute are dropped up front
+        query_weights = {}
+        for term, count in query_counts.items():
+            if term not in term_stats:
+                continue
+            term_id, doc_freq = term_stats[term]
+            if ranking == 'bm25':
+                query_weights[term_id] = bm25_idf(total_docs, doc_freq) * count * (k1 + 1)
+                continue
+            idf = math.log(total_docs / doc_freq)
+            if idf > 0:
+                query_weights[term_id] = idf * count
+        if not query_weights:
+            return []
         
-        for doc_id, filename in documents:
-            score = 0.0
-            
-            for term in query_words:
-                # Get TF score for this term in this document
+        values = ', '.join(['(?, ?)'] * len(query_weights))
+        params = [value for item in query_weights.items() for value in item]
+        if ranking == 'bm25':
+            # Saturate each frequency against the document's length relative
+            # to the average, both precomputed at ingestion time
+            average_length = (total_words / total_docs if total_docs else 0) or 1.0
+            posting_score = 'tf.frequency / (tf.frequency + ? * (1 - ? + ? * COALESCE(d.word_count, 0) / ?))'
+            params += [k1, b, b, average_length]
+        else:
+            posting_score = 'tf.tf_score'
+        
+        boost = ''
+        if pagerank_weight:
+            # Scale by 1 - w + w * PageRank relative to an average document
+            boost = ' * (1 - ? + ? * COALESCE(d.pagerank * ?, 1))'
+            params += [pagerank_weight, pagerank_weight, total_docs]
+        
+        where = ''
+        if documents is not None:
+            # One JSON array parameter, however many documents there are
+            where = 'WHERE tf.document_id IN (SELECT value FROM json_each(?))'
+            params.append(json.dumps(sorted(documents)))
+        
+        # Score every matching document in one pass over the postings of
+        # the query terms only
+        cursor.execute(f'''
+            WITH query (term_id, weight) AS (VALUES {values})
+            SELECT d.filename, SUM({posting_score} * q.weight){boost} AS score
+            FROM query q
+            JOIN term_frequency tf ON tf.term_id = q.term_id
+            JOIN documents d ON d.id = tf.document_id
+            {where}
+            GROUP BY tf.document_id
+            HAVING score > 0
+            ORDER BY score DESC, d.filename
+            LIMIT ?
+        ''', params + [top_n])
+        
+        return cursor.fetchall()
+    
+    def _score_fts5(self, cursor, query_counts: Dict[str, int], top_n: int,
+                    pagerank_weight: float = 0.0,
+                    documents: Optional[Iterable[int]] = None) -> List[Tuple[str, float]]:
+        """Rank documents with one FTS5 MATCH ordered by its built-in bm25().
+        
+        Any query term matches. FTS5 scores every term alike with fixed
+        k1=1.2 and b=0.75, so repeated or corrected query terms carry no
+        extra weight. documents restricts the results to the given ids.
+        """
+        if not query_counts:
+            # MATCH '' is a syntax error
+            return []
+        match = ' OR '.join(f'"{term}"' for term in sorted(query_counts))
+        params = [match]
+        where = ''
+        if documents is not None:
+            where = 'AND document_fts.rowid IN (SELECT value FROM json_each(?))'
+            params.append(json.dumps(sorted(documents)))
+        
+        if not pagerank_weight:
+            # FTS5 finds the top rows itself; only those are joined to
+            # their file names. bm25() is negative, better matches lower.
+            cursor.execute(f'''
+                SELECT d.filename, -f.rank AS score
+                FROM (
+                    SELECT rowid, bm25(document_fts) AS rank FROM document_fts
+                    WHERE document_fts MATCH ? {where}
+                    ORDER BY rank
+                    LIMIT ?
+                ) f
+                JOIN documents d ON d.id = f.rowid
+                ORDER BY f.rank, d.filename
+            ''', params + [top_n])
+            return cursor.fetchall()
+        
+        # The blended score depends on every match's PageRank
+        total_docs = self.database.collection_stat(cursor, 'total_docs') or 0
+        cursor.execute(f'''
+            SELECT d.filename,
+                   -bm25(document_fts) * (1 - ? + ? * COALESCE(d.pagerank * ?, 1)) AS score
+            FROM document_fts
+            JOIN documents d ON d.id = document_fts.rowid
+            WHERE document_fts MATCH ? {where}
+            ORDER BY score DESC, d.filename
+            LIMIT ?
+        ''', [pagerank_weight, pagerank_weight, total_docs] + params + [top_n])
+        return cursor.fetchall()
+    
+    def suggest(self, word: str, max_distance: Optional[int] = None) -> List[Tuple[str, int, int]]:
+        """Closest vocabulary terms to a word, as (term, edit distance, document frequency).
+        
+        Returns the terms at the smallest edit distance, up to max_distance,
+        at which there are any, most frequent first. max_distance is at most
+        FUZZY_MAX_DISTANCE and defaults to the distance used to correct
+        query words (see _fuzzy_distance()).
+        """
+        self._require_database("suggest()")
+        words = self.preprocess_text(word)
+        if not words:
+            return []
+        if max_distance is None:
+            max_distance = self._fuzzy_distance(words[0])
+        max_distance = min(max_distance, FUZZY_MAX_DISTANCE)
+        if not max_distance:
+            return []
+        cursor = self.connections.connection().cursor()
+        return self._suggestions(cursor, words[0], max_distance)
+    
+    def _fuzzy_distance(self, word: str) -> int:
+        """Edits allowed when correcting a query word: fewer for short words."""
+        if len(word) <= FUZZY_SHORT_WORD:
+            return min(self.max_edit_distance, 1)
+        return self.max_edit_distance
+    
+    def _suggestions(self, cursor, word: str, max_distance: int) -> List[Tuple[str, int, int]]:
+        """Look a word up in the SymSpell deletion index, closest terms only.
+        
+        A term within n edits shares a delete with the word that both reach
+        in at most n deletions, so one indexed lookup of the word's own
+        deletes finds every candidate, and only those candidates of a fitting
+        length are compared letter by letter. One edit is tried before two,
+        which keeps the candidates of the common single typo few.
+        """
+        deletes = term_deletes(word, max_distance)
+        for distance in range(1, max_distance + 1):
+            keys = sorted(key for key, deletions in deletes.items() if deletions <= distance)
+            cursor.execute('''
+                SELECT DISTINCT t.term, s.doc_freq
+                FROM term_deletes d
+                JOIN terms t ON t.id = d.term_id
+                JOIN term_stats s ON s.term_id = d.term_id
+                WHERE d.delete_key IN (SELECT value FROM json_each(?)) AND d.deletions <= ?
+                    AND length(t.term) BETWEEN ? AND ?
+            ''', (json.dumps(keys), distance, len(word) - distance, len(word) + distance))
+            suggestions = []
+            for term, doc_freq in cursor.fetchall():
+                term_distance = edit_distance(word, term, distance)
+                if term_distance <= distance:
+                    suggestions.append((term, term_distance, doc_freq))
+            if suggestions:
+                closest = min(term_distance for term, term_distance, doc_freq in suggestions)
+                return sorted((suggestion for suggestion in suggestions
+                               if suggestion[1] == closest),
+                              key=lambda item: (-item[2], item[0]))
+        return []
+    
+    def _corrections(self, cursor, words: Iterable[str]) -> Dict[str, List[Tuple[str, float]]]:
+        """Spelling corrections for the words that are not in the index.
+        
+        Each word maps to up to FUZZY_EXPANSIONS of the closest terms, with
+        weights proportional to their document frequency that sum to 1.
+        """
+        if not self.max_edit_distance:
+            return {}
+        words = set(words)
+        corrections = {}
+        for word in sorted(words - set(self._term_stats(cursor, words))):
+            suggestions = self._suggestions(cursor, word, self._fuzzy_distance(word))
+            if not suggestions:
+                continue
+            closest = [(term, doc_freq)
+                       for term, distance, doc_freq in suggestions[:FUZZY_EXPANSIONS]]
+            total = sum(doc_freq for term, doc_freq in closest)
+            corrections[word] = [(term, doc_freq / total) for term, doc_freq in closest]
+            print(f"'{word}' is not in the index; searching "
+                  f"{', '.join(term for term, doc_freq in closest)} instead")
+        return corrections
+    
+    def _corrected_counts(self, query_counts: Dict[str, float],
+                          corrections: Dict[str, List[Tuple[str, float]]]) -> Counter:
+        """Move the counts of corrected words onto their corrections, by weight."""
+        corrected = Counter()
+        for word, count in query_counts.items():
+            for term, weight in corrections.get(word, [(word, 1)]):
+                corrected[term] += count * weight
+        return corrected
+    
+    def _correct_tree(self, tree: QueryNode, corrections: Dict[str, List[Tuple[str, float]]]):
+        """Turn the term nodes of corrected words into ORs of their corrections."""
+        pending = [tree]
+        while pending:
+            node = pending.pop()
+            pending.extend(node.children)
+            if node.op == 'term' and node.value in corrections:
+                node.op = 'or'
+                node.children = [QueryNode('term', value=term)
+                                 for term, weight in corrections[node.value]]
+                node.value = None
+    
+    def _expand_wildcard(self, cursor, pattern: str) -> List[str]:
+        """Vocabulary terms matching a wildcard pattern, most frequent first.
+        
+        Only the range of the unique terms index starting with the pattern's
+        literal prefix is read, so the vocabulary is never scanned; patterns
+        starting with a wildcard are therefore not supported. At most
+        max_expansions terms are returned.
+        """
+        pattern = re.sub(r'[^a-z*?]', '', pattern.lower())
+        prefix = WILDCARD_CHARS.split(pattern)[0]
+        if not prefix:
+            print(f"Wildcard term '{pattern}' needs at least one leading letter; ignoring it")
+            return []
+        # Every term starting with prefix sorts below this bound
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        cursor.execute('''
+            SELECT t.term FROM terms t
+            JOIN term_stats s ON s.term_id = t.id
+            WHERE t.term >= ? AND t.term < ? AND t.term GLOB ?
+            ORDER BY s.doc_freq DESC, t.term
+            LIMIT ?
+        ''', (prefix, upper, pattern, self.max_expansions))
+        return [row[0] for row in cursor.fetchall()]
+    
+    def _expand_wildcards(self, cursor, query: str) -> Tuple[str, List[str]]:
+        """Take the wildcard terms out of a query, returning it and their expansions.
+        
+        Quoted phrases are left alone. Each wildcard term is replaced by a
+        bare * so it cannot become the operand of a NEAR constraint.
+        """
+        expansions = []
+        
+        def expand(match):
+            token = match.group()
+            if token.startswith('"'):
+                return token
+            expansions.extend(self._expand_wildcard(cursor, token))
+            return '*'
+        
+        return WILDCARD_TERM.sub(expand, query), expansions
+    
+    def _parse_positional_query(self, query: str):
+        """Split a query into its phrases, NEAR constraints and the text to score.
+        
+        Phrases are tuples of (offset, word) relative to their first word;
+        NEAR constraints are (word, distance, word) tuples. Every word,
+        inside phrases and NEAR constraints too, stays in the scored text.
+        """
+        phrases = []
+        for phrase_text in PHRASE.findall(query):
+            words, end = self.tokenize_positions(phrase_text)
+            if words:
+                first = words[0][0]
+                phrases.append(tuple((position - first, word) for position, word in words))
+        
+        proximities = []
+        for left, distance, right in NEAR.findall(PHRASE.sub(' ', query)):
+            left_words = self.preprocess_text(left)
+            right_words = self.preprocess_text(right)
+            if left_words and right_words:
+                proximities.append((left_words[-1], int(distance), right_words[0]))
+        
+        return tuple(phrases), tuple(proximities), NEAR_OPERATOR.sub(' ', query)
+    
+    def _positional_matches(self, cursor, phrases, proximities,
+                            documents: Optional[set] = None) -> set:
+        """Ids of the documents that satisfy every phrase and NEAR constraint.
+        
+        With documents, only those documents are considered.
+        """
+        terms = {word for phrase in phrases for offset, word in phrase}
+        terms.update(word for left, distance, right in proximities for word in (left, right))
+        term_stats = self._term_stats(cursor, terms)
+        if len(term_stats) < len(terms):
+            return set()
+        
+        # Each constraint only looks at the documents the previous ones kept
+        for phrase in phrases:
+            postings, documents = self._term_positions(
+                cursor, [word for offset, word in phrase], term_stats, documents)
+            if len(phrase) > 1:
+                documents = {document_id for document_id in documents
+                             if self._contains_phrase(phrase, postings, document_id)}
+            if not documents:
+                return set()
+        
+        for left, distance, right in proximities:
+            postings, documents = self._term_positions(cursor, [left, right], term_stats,
+                                                       documents)
+            matches = set()
+            for document_id in documents:
+                left_positions = decode_positions(postings[left][document_id])
+                if left == right:
+                    near = any(later - earlier <= distance + 1 for earlier, later
+                               in zip(left_positions, left_positions[1:]))
+                else:
+                    right_positions = decode_positions(postings[right][document_id])
+                    near = _within_distance(left_positions, right_positions, distance + 1)
+                if near:
+                    matches.add(document_id)
+            documents = matches
+            if not documents:
+                return set()
+        
+        return documents
+    
+    def _term_positions(self, cursor, terms: Iterable[str], term_stats: Dict[str, Tuple[int, int]],
+                        documents: Optional[set] = None):
+        """Read the encoded positions of terms in the documents containing all of them.
+        
+        Terms are read rarest first and each read is restricted to the
+        documents still in the running. Returns {term: {document_id: blob}}
+        and the set of documents containing every term.
+        """
+        postings = {}
+        for term in sorted(set(terms), key=lambda term: term_stats[term][1]):
+            term_id = term_stats[term][0]
+            if documents is None:
                 cursor.execute('''
-                    SELECT tf_score FROM term_frequency
-                    WHERE document_id = ? AND term = ?
-                ''', (doc_id, term))
-                
-                result = cursor.fetchone()
-                if result and term in idf_scores:
-                    tf_score = result[0]
-                    idf_score = idf_scores[term]
-                    tfidf_score = tf_score * idf_score
-                    score += tfidf_score
+                    SELECT document_id, positions FROM term_positions WHERE term_id = ?
+                ''', (term_id,))
+            else:
+                cursor.execute('''
+                    SELECT document_id, positions FROM term_positions
+                    WHERE term_id = ? AND document_id IN (SELECT value FROM json_each(?))
+                ''', (term_id, json.dumps(sorted(documents))))
+            postings[term] = dict(cursor.fetchall())
+            documents = set(postings[term])
+            if not documents:
+                break
+        return postings, documents or set()
+    
+    def _contains_phrase(self, phrase, postings, document_id: int) -> bool:
+        """Whether the phrase's words occur at their offsets somewhere in a document."""
+        positions = {word: set(decode_positions(postings[word][document_id]))
+                     for offset, word in phrase}
+        # Anchor on the word with the fewest occurrences
+        anchor_offset, anchor = min(phrase, key=lambda item: len(positions[item[1]]))
+        for position in positions[anchor]:
+            start = position - anchor_offset
+            if all(start + offset in positions[word] for offset, word in phrase):
+                return True
+        return False
+    
+    def _parse_boolean_query(self, query: str,
+                             cursor=None) -> Tuple[Optional[QueryNode], List[str]]:
+        """Parse a boolean query into a QueryNode tree and the words to score.
+        
+        NOT binds tightest, then AND; adjacent clauses and OR match documents
+        containing any of them, like a plain query. Among adjacent clauses,
+        +clause is required and -clause or NOT clause excluded, so ``a +b -c``
+        matches documents with b and without c, a only adding to the score.
+        Quoted phrases and ``word NEAR/n word`` are clauses too, and with a
+        cursor wildcard terms match any of their expansions. Stop words drop
+        out of the tree; the scored words are those not excluded.
+        """
+        tokens = []
+        depth = 0
+        for token in QUERY_TOKEN.findall(query):
+            # Unmatched closing parentheses are ignored
+            if token == ')':
+                if not depth:
+                    continue
+                depth -= 1
+            elif token == '(':
+                depth += 1
+            tokens.append(token)
+        position = 0
+        scored = []
+        
+        def peek():
+            return tokens[position] if position < len(tokens) else None
+        
+        def clauses(negated):
+            nonlocal position
+            required, optional, excluded = [], [], []
+            while peek() not in (None, ')'):
+                if peek() == 'OR':
+                    position += 1
+                    continue
+                node = conjunction(negated)
+                if node is None:
+                    continue
+                if node.op == 'required':
+                    required.append(node.children[0])
+                elif node.op == 'not':
+                    excluded.append(node)
+                else:
+                    optional.append(node)
+            if required:
+                node = _combine_nodes('and', required)
+            else:
+                node = _combine_nodes('or', optional)
+            if excluded:
+                node = _combine_nodes('and', [node or QueryNode('all')] + excluded)
+            return node
+        
+        def conjunction(negated):
+            nonlocal position
+            nodes = [negation(negated)]
+            while peek() == 'AND':
+                position += 1
+                nodes.append(negation(negated))
+            if len(nodes) == 1:
+                return nodes[0]
+            return _combine_nodes('and', nodes)
+        
+        def negation(negated):
+            nonlocal position
+            token = peek()
+            if token in ('NOT', '-'):
+                position += 1
+                node = negation(not negated)
+                return node and QueryNode('not', [node])
+            if token == '+':
+                position += 1
+                node = negation(negated)
+                return node and QueryNode('required', [node])
+            return primary(negated)
+        
+        def primary(negated):
+            nonlocal position
+            token = peek()
+            if token in (None, ')', 'AND', 'OR'):
+                return None
+            position += 1
+            if token == '(':
+                node = clauses(negated)
+                if peek() == ')':
+                    position += 1
+                return node
+            if token.startswith('"'):
+                words, end = self.tokenize_positions(token.strip('"'))
+                if not negated:
+                    scored.extend(word for offset, word in words)
+                if len(words) > 1:
+                    first = words[0][0]
+                    return QueryNode('phrase', value=tuple((offset - first, word)
+                                                           for offset, word in words))
+                return QueryNode('term', value=words[0][1]) if words else None
+            if NEAR_OPERATOR.fullmatch(token):
+                # A NEAR without a word on its left
+                return None
+            wildcard = WILDCARD_TERM.search(token)
+            if wildcard:
+                expansions = self._expand_wildcard(cursor, wildcard.group()) if cursor else []
+                if not negated:
+                    scored.extend(expansions)
+                # A pattern without expansions stays a term that matches nothing
+                return _combine_nodes('or', [QueryNode('term', value=term)
+                                             for term in expansions]) or \
+                    QueryNode('term', value=token)
             
-            if score > 0:
-                doc_scores[filename] = score
+            words = self.preprocess_text(token)
+            if not words:
+                return None
+            left = words[0]
+            if not negated:
+                scored.append(left)
+            proximities = []
+            while left and NEAR_OPERATOR.fullmatch(peek() or ''):
+                distance = int(peek().split('/')[1])
+                position += 1
+                right = peek()
+                if right is None or right in ('(', ')', 'AND', 'OR', 'NOT', '+', '-') \
+                        or right.startswith('"'):
+                    break
+                position += 1
+                right_words = self.preprocess_text(right)
+                if not right_words:
+                    break
+                if not negated:
+                    scored.append(right_words[0])
+                proximities.append(QueryNode('near', value=(left, distance, right_words[0])))
+                left = right_words[0]
+            if proximities:
+                return _combine_nodes('and', proximities)
+            return QueryNode('term', value=left)
         
-        conn.close()
+        tree = clauses(False)
+        return tree, scored
+    
+    def _boolean_matches(self, cursor, tree: QueryNode,
+                         index: Optional[InMemoryIndex] = None) -> List[int]:
+        """Sorted ids of the documents matching a boolean query tree.
+        
+        Every node is evaluated over sorted document id lists, read from the
+        in-memory index if one is given and from the term_frequency index
+        otherwise. The clauses of an AND are applied cheapest first, each
+        one only to the documents that survived the previous ones: lists
+        are intersected by galloping from the shorter one, and the
+        surviving documents are looked up in the index range of a much
+        longer list instead of reading it. Conjunctions therefore cost
+        about as much as their shortest list.
+        """
+        terms = set()
+        positional_nodes = []
+        pending = [tree]
+        while pending:
+            node = pending.pop()
+            pending.extend(node.children)
+            if node.op == 'term':
+                terms.add(node.value)
+            elif node.op == 'phrase':
+                terms.update(word for offset, word in node.value)
+                positional_nodes.append(node)
+            elif node.op == 'near':
+                terms.update((node.value[0], node.value[2]))
+                positional_nodes.append(node)
+        term_stats = self._term_stats(cursor, terms)
+        
+        has_positions = False
+        if positional_nodes:
+            cursor.execute('SELECT 1 FROM term_positions LIMIT 1')
+            has_positions = cursor.fetchone() is not None
+            if not has_positions:
+                print("Phrase and NEAR queries need a positional index; index documents "
+                      "with PDFTextAnalyzer(..., positional=True). Searching the words instead.")
+        
+        empty = _whole(())
+        postings_cache = {}
+        
+        def postings(term):
+            if term not in postings_cache:
+                if index is not None:
+                    postings_cache[term] = index.postings(term)
+                elif term not in term_stats:
+                    postings_cache[term] = empty
+                else:
+                    # A range scan of the covering (term_id, document_id) index
+                    cursor.execute('''
+                        SELECT document_id FROM term_frequency
+                        WHERE term_id = ? ORDER BY document_id
+                    ''', (term_stats[term][0],))
+                    postings_cache[term] = _whole(array('q', (row[0] for row in cursor)))
+            return postings_cache[term]
         
-        # Sort by score and return top N
-        sorted_results = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)
-        return sorted_results[:top_n]
+        def universe():
+            if index is not None:
+                return _whole(sorted(index.doc_names))
+            cursor.execute('SELECT id FROM documents ORDER BY id')
+            return _whole([row[0] for row in cursor])
+        
+        def doc_freq(term):
+            return term_stats[term][1] if term in term_stats else 0
+        
+        def estimate(node):
+            # Upper bound of the number of matches, to order AND clauses
+            if node.op == 'term':
+                return doc_freq(node.value)
+            if node.op == 'phrase':
+                return min(doc_freq(word) for offset, word in node.value)
+            if node.op == 'near':
+                return min(doc_freq(node.value[0]), doc_freq(node.value[2]))
+            if node.op == 'and':
+                return min(map(estimate, node.children))
+            if node.op == 'or':
+                return sum(map(estimate, node.children))
+            if node.op == 'required':
+                return estimate(node.children[0])
+            # Negations and 'all' only remove from what is left, so go last
+            return math.inf
+        
+        def restrict(term, candidates):
+            sequence, start, end = candidates
+            if index is not None or (end - start) * RESTRICT_RATIO >= doc_freq(term):
+                return _whole(intersect_postings([candidates, postings(term)]))
+            # Far fewer candidates than postings: seek each candidate in the
+            # term's index range instead of reading the whole list
+            cursor.execute('''
+                SELECT document_id FROM term_frequency
+                WHERE term_id = ? AND document_id IN (SELECT value FROM json_each(?))
+            ''', (term_stats[term][0], json.dumps(list(sequence[start:end]))))
+            return _whole(sorted(row[0] for row in cursor))
+        
+        def matches(node, candidates):
+            # Documents matching node, among candidates unless None
+            if candidates is not None and candidates[1] == candidates[2]:
+                return empty
+            if node.op == 'term':
+                if candidates is None:
+                    return postings(node.value)
+                if node.value not in term_stats:
+                    return empty
+                return restrict(node.value, candidates)
+            if node.op in ('phrase', 'near'):
+                if node.op == 'phrase':
+                    words = [word for offset, word in node.value]
+                    phrases, proximities = (node.value,), ()
+                else:
+                    words = [node.value[0], node.value[2]]
+                    phrases, proximities = (), (node.value,)
+                if not has_positions:
+                    return matches(_combine_nodes('and', [QueryNode('term', value=word)
+                                                          for word in words]), candidates)
+                documents = None
+                if candidates is not None:
+                    sequence, start, end = candidates
+                    documents = set(sequence[start:end])
+                return _whole(sorted(self._positional_matches(cursor, phrases, proximities,
+                                                              documents)))
+            if node.op == 'required':
+                return matches(node.children[0], candidates)
+            if node.op == 'all':
+                return universe() if candidates is None else candidates
+            if node.op == 'not':
+                if candidates is None:
+                    candidates = universe()
+                return _whole(subtract_postings(candidates,
+                                                matches(node.children[0], candidates)))
+            if node.op == 'or':
+                return _whole(union_postings(matches(child, candidates)
+                                             for child in node.children))
+            # AND: each clause only sees what the cheaper ones kept
+            for child in sorted(node.children, key=estimate):
+                candidates = matches(child, candidates)
+                if candidates[1] == candidates[2]:
+                    break
+            return candidates
+        
+        sequence, start, end = matches(tree, None)
+        return list(sequence[start:end])
     
-    def list_documents(self):
-        """List all documents in the database."""
-        conn = sqlite3.connect(self.db_path)
+    def search_many(self, queries: Iterable[str], top_n: int = 10,
+                    workers: Optional[int] = None, engine: Optional[str] = None,
+                    ranking: Optional[str] = None, k1: Optional[float] = None,
+                    b: Optional[float] = None, pagerank_weight: Optional[float] = None,
+                    batch_size: int = 64) -> Iterator[Tuple[str, List[Tuple[str, float]]]]:
+        """Search many queries at once, yielding (query, results) pairs.
+        
+        All queries are tokenized up front and the collection and term
+        statistics they need are read once. The 'memory', 'sparse' and
+        'segment' engines score every query against their current snapshot
+        and 'fts5' runs one MATCH per query. The 'sql' engine scores each
+        query in SQLite with the shared statistics, or, when NumPy and SciPy
+        are available and the queries share enough terms, loads the postings
+        of the union of their terms once into a query-scoped SparseIndex and
+        scores them as matrix products.
+        
+        Queries are scored in batches of ``batch_size``. With ``workers`` the
+        batches run on a thread pool (SQL scoring runs on per-thread
+        connections and releases the GIL) and are yielded as they finish, so
+        the pairs only come back in input order without workers.
+        """
+        engine, ranking, k1, b, pagerank_weight = self._search_options(
+            engine, ranking, k1, b, pagerank_weight)
+        if self.database is None:
+            for query in queries:
+                yield query, self.search(query, top_n, engine, ranking, k1, b, pagerank_weight)
+            return
+        conn = self.connections.connection()
         cursor = conn.cursor()
+        parsed = []
+        for query in queries:
+            if BOOLEAN_SYNTAX.search(query):
+                tree, words = self._parse_boolean_query(query, cursor)
+                parsed.append((query, Counter(words), True))
+                continue
+            text, expansions = self._expand_wildcards(cursor, query)
+            phrases, proximities, text = self._parse_positional_query(text)
+            parsed.append((query, Counter(self.preprocess_text(text) + expansions),
+                           bool(phrases or proximities)))
+        # Boolean, phrase and NEAR queries are corrected by search()
+        corrections = self._corrections(cursor, {term for query, query_counts, filtered
+                                                 in parsed if not filtered
+                                                 for term in query_counts})
+        queries = [(query, self._corrected_counts(query_counts, corrections)
+                    if corrections and not filtered else query_counts, filtered)
+                   for query, query_counts, filtered in parsed]
+        
+        index = None
+        shared_index = False
+        if engine == 'sql':
+            terms = {term for query, query_counts, filtered in queries for term in query_counts}
+            # Statistics (and shared postings) come from one snapshot
+            in_transaction = conn.in_transaction
+            if not in_transaction:
+                cursor.execute('BEGIN')
+            try:
+                total_docs = self.database.collection_stat(cursor, 'total_docs') or 0
+                total_words = self.database.collection_stat(cursor, 'total_words') or 0
+                term_stats = self._term_stats(cursor, terms)
+                total_postings = sum(doc_freq for term_id, doc_freq in term_stats.values())
+                query_postings = sum(term_stats[term][1] for query, query_counts, filtered
+                                     in queries for term in query_counts if term in term_stats)
+                # Loading a posting into Python costs about as much as
+                # scoring it in SQLite, while scoring loaded postings is
+                # vectorized, so sharing pays off once postings are re-read
+                if np is not None and query_postings >= SHARED_POSTINGS_RATIO * total_postings:
+                    index = SparseIndex.load(cursor, terms)
+            finally:
+                if not in_transaction:
+                    conn.commit()
+        elif engine == 'fts5':
+            if not self._check_fts(cursor):
+                for query, query_counts, filtered in queries:
+                    yield query, []
+                return
+        else:
+            index = self._current_index(conn, engine)
+            shared_index = True
+        
+        thread_connections = set()
+        
+        def score(batch):
+            results = [None] * len(batch)
+            if index is not None:
+                plain = [i for i, (query, query_counts, filtered) in enumerate(batch)
+                         if not filtered]
+                scored = index.search_batch([batch[i][1] for i in plain], top_n, ranking,
+                                            k1, b, pagerank_weight)
+                for i, result in zip(plain, scored):
+                    results[i] = result
+            
+            pending = [i for i, result in enumerate(results) if result is None]
+            if pending:
+                batch_conn = self.connections.connection()
+                if batch_conn is not conn:
+                    thread_connections.add(batch_conn)
+                batch_cursor = batch_conn.cursor()
+            for i in pending:
+                query, query_counts, filtered = batch[i]
+                if filtered:
+                    # Boolean, phrase and NEAR queries need their own candidate set
+                    results[i] = self.search(query, top_n, 'fts5' if engine == 'fts5' else 'sql',
+                                             ranking, k1, b, pagerank_weight)
+                elif engine == 'fts5':
+                    results[i] = self._score_fts5(batch_cursor, query_counts, top_n,
+                                                  pagerank_weight)
+                else:
+                    results[i] = self._score_sql(batch_cursor, query_counts, term_stats,
+                                                 total_docs, total_words, top_n, ranking,
+                                                 k1, b, pagerank_weight)
+            return [(query, result) for (query, query_counts, filtered), result
+                    in zip(batch, results)]
         
-        cursor.execute('SELECT filename, word_count FROM documents ORDER BY filename')
-        documents = cursor.fetchall()
+        batches = [queries[i:i + batch_size] for i in range(0, len(queries), batch_size)]
+        try:
+            if not workers:
+                for batch in batches:
+                    yield from score(batch)
+                return
+            
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(score, batch) for batch in batches]
+                try:
+                    for future in as_completed(futures):
+                        yield from future.result()
+                finally:
+                    # Stop scoring batches nobody will read if the caller
+                    # stops early
+                    for future in futures:
+                        future.cancel()
+        finally:
+            # The pool's threads are gone, so are the users of their connections
+            for thread_conn in thread_connections:
+                self.connections.release(thread_conn)
+            if shared_index:
+                self._release_index(index)
+    
+    def _search_options(self, engine: Optional[str], ranking: Optional[str],
+                        k1: Optional[float], b: Optional[float],
+                        pagerank_weight: Optional[float]):
+        """Resolve per-call search options against the analyzer's defaults."""
+        engine = self._check_engine(engine) if engine else self.engine
+        ranking = self._check_ranking(ranking) if ranking else self.ranking
+        k1 = self.k1 if k1 is None else k1
+        b = self.b if b is None else b
+        pagerank_weight = self.pagerank_weight if pagerank_weight is None else \
+            self._check_pagerank_weight(pagerank_weight)
+        return engine, ranking, k1, b, pagerank_weight
+    
+    def _current_index(self, conn: Optional[sqlite3.Connection], engine: str):
+        """Return the engine's in-memory index, reloading it if the storage changed.
+        
+        Every write bumps the 'generation' collection stat, so one primary
+        key lookup per search detects changes from any connection or process.
+        Without SQLite storage (conn is None) the index is loaded from the
+        storage backend and its collection_stats() generation is checked.
+        The caller must hand the index back with _release_index() when done,
+        so that an index replaced in the meantime is closed once unused.
+        """
+        if conn is None:
+            generation = self.storage.collection_stats().generation
+        else:
+            generation = self.database.collection_stat(conn.cursor(), 'generation') or 0
+        with self._index_lock:
+            index = self._indexes.get(engine)
+            if index is None or index.generation != generation:
+                loaded = self._load_index(conn, engine)
+                if index is not None:
+                    self._retire_index(index)
+                index = self._indexes[engine] = loaded
+            self._index_users[id(index)] += 1
+        return index
+    
+    def _load_index(self, conn: Optional[sqlite3.Connection], engine: str):
+        """Load a snapshot of the storage into the engine's index class."""
+        if conn is None:
+            return INDEX_ENGINES[engine].from_storage(self.storage)
+        # Read the snapshot in one transaction so postings, names and the
+        # generation all belong to the same version
+        cursor = conn.cursor()
+        in_transaction = conn.in_transaction
+        if not in_transaction:
+            cursor.execute('BEGIN')
+        try:
+            return INDEX_ENGINES[engine].load(cursor)
+        finally:
+            if not in_transaction:
+                conn.commit()
+    
+    def _release_index(self, index):
+        """Hand back an index from _current_index(), closing it if it was replaced."""
+        with self._index_lock:
+            self._index_users[id(index)] -= 1
+            if self._index_users[id(index)] == 0:
+                del self._index_users[id(index)]
+                if self._retired_indexes.pop(id(index), None) is not None:
+                    index.close()
+    
+    def _retire_index(self, index):
+        """Close a replaced index now, or once its last search hands it back."""
+        if self._index_users[id(index)]:
+            self._retired_indexes[id(index)] = index
+        else:
+            index.close()
+    
+    def list_documents(self):
+        """List all documents in the storage."""
+        documents = sorted((document.filename, document.word_count)
+                           for document_id, document in self.storage.documents())
         
         if documents:
             print("\nDocuments in database:")
@@ -244,16 +3950,15 @@ class PDFTextAnalyzer:
                 print(f"{filename} ({word_count} words)")
         else:
             print("No documents in database")
-        
-        conn.close()
     
     def get_document_stats(self, filename: str):
         """Get statistics for a specific document."""
-        conn = sqlite3.connect(self.db_path)
+        self._require_database("get_document_stats()")
+        conn = self.connections.connection()
         cursor = conn.cursor()
         
         cursor.execute('''
-            SELECT d.content, d.word_count, COUNT(tf.term) as unique_terms
+            SELECT d.id, d.word_count, d.pagerank, COUNT(tf.term_id) as unique_terms
             FROM documents d
             LEFT JOIN term_frequency tf ON d.id = tf.document_id
             WHERE d.filename = ?
@@ -262,17 +3967,21 @@ class PDFTextAnalyzer:
         
         result = cursor.fetchone()
         if result:
-            content, word_count, unique_terms = result
+            document_id, word_count, rank, unique_terms = result
             print(f"\nDocument: {filename}")
             print(f"Total words: {word_count}")
             print(f"Unique terms: {unique_terms}")
-            print(f"Content preview: {content[:200]}...")
+            if rank is not None:
+                print(f"PageRank: {rank:.6f}")
+            # Only the first chunk or so of the stored text is decompressed
+            print(f"Content preview: {self._document_text(cursor, document_id, 200)}...")
             
             # Get top 10 most frequent terms
             cursor.execute('''
-                SELECT term, frequency, tf_score
+                SELECT t.term, tf.frequency, tf.tf_score
                 FROM term_frequency tf
                 JOIN documents d ON tf.document_id = d.id
+                JOIN terms t ON t.id = tf.term_id
                 WHERE d.filename = ?
                 ORDER BY frequency DESC
                 LIMIT 10
@@ -283,8 +3992,17 @@ class PDFTextAnalyzer:
                 print(f"  {term}: {freq} times (TF: {tf_score:.4f})")
         else:
             print(f"Document '{filename}' not found in database")
-        
-        conn.close()
+    
+    def get_document_text(self, filename: str) -> Optional[str]:
+        """Return the stored text of a document, or None if it is not indexed."""
+        self._require_database("get_document_text()")
+        cursor = self.connections.connection().cursor()
+        cursor.execute('SELECT id FROM documents WHERE filename = ?', (filename,))
+        row = cursor.fetchone()
+        if row is None:
+            print(f"Document '{filename}' not found in database")
+            return None
+        return self._document_text(cursor, row[0])
 
 
 def main():
@@ -300,9 +4018,10 @@ def main():
         print("2. Search documents")
         print("3. List all documents")
         print("4. Get document statistics")
-        print("5. Exit")
+        print("5. Remove a document")
+        print("6. Exit")
         
-        choice = input("\nEnter your choice (1-5): ").strip()
+        choice = input("\nEnter your choice (1-6): ").strip()
         
         if choice == '1':
             pdf_path = input("Enter the path to the PDF file: ").strip()
@@ -311,12 +4030,14 @@ def main():
         elif choice == '2':
             query = input("Enter your search query: ").strip()
             if query:
-                results = analyzer.search(query)
+                results = analyzer.search_detailed(query, pages=1)
                 if results:
                     print(f"\nTop 10 matching documents for '{query}':")
                     print("-" * 60)
-                    for i, (filename, score) in enumerate(results, 1):
-                        print(f"{i:2d}. {filename} (Score: {score:.4f})")
+                    for i, result in enumerate(results, 1):
+                        print(f"{i:2d}. {result.filename} (Score: {result.score:.4f})")
+                        for page in result.pages:
+                            print(f"    Page {page.page}: {page.snippet}")
                 else:
                     print("No matching documents found.")
             else:
@@ -330,11 +4051,16 @@ def main():
             analyzer.get_document_stats(filename)
         
         elif choice == '5':
+            filename = input("Enter the filename: ").strip()
+            analyzer.remove_document(filename)
+        
+        elif choice == '6':
+            analyzer.close()
             print("Goodbye!")
             break
         
         else:
-            print("Invalid choice. Please enter 1-5.")
+            print("Invalid choice. Please enter 1-6.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,454 @@
+"""
+Storage backends for the PDF search index.
+
+StorageBackend is the interface to the storage behind the index: adding
+and removing documents, the postings of a term, and the document and
+collection statistics that scoring needs. PDFTextAnalyzer stores its
+documents in one, and three backends implement it:
+
+- SQLiteStorage (in pageRank.py): an SQLite database, the analyzer's
+  default, which also holds what its SQL search features need
+- MemoryStorage: plain dictionaries, for tests and ephemeral workloads
+- SegmentStorage: an immutable segment file holding a sorted term
+  dictionary and packed postings arrays, opened with mmap so that every
+  process searching it shares one copy in the page cache
+
+Any backend can be searched through InMemoryIndex.from_storage() in
+pageRank.py, and written to a segment with SegmentStorage.write().
+"""
+import contextlib
+import io
+import math
+import mmap
+import os
+import struct
+import uuid
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+@dataclass
+class DocumentStats:
+    """Per-document statistics used for scoring."""
+    filename: str
+    word_count: int
+    pagerank: Optional[float] = None
+
+
+@dataclass
+class CollectionStats:
+    """Collection-wide statistics used for scoring."""
+    total_docs: int
+    total_words: int
+    generation: float = 0
+    # Random UUID of the database the statistics come from, '' if none
+    database_id: str = ''
+
+
+class StorageBackend(ABC):
+    """Storage of documents, their term postings and the index statistics.
+    
+    Postings are returned as two parallel sequences, the ids of the
+    documents containing the term in ascending order and the term's
+    frequency in each.
+    """
+    
+    @abstractmethod
+    def add_document(self, filename: str, term_counts: Dict[str, int], word_count: int,
+                     text="", links: Iterable[str] = (),
+                     positions: Optional[Dict[str, List[int]]] = None,
+                     pages=None) -> int:
+        """Add a document, replacing any document with the same filename; returns its id.
+        
+        text, the file names the document links to, its terms' token
+        positions and its page data are kept by backends that use them and
+        ignored by the others.
+        """
+    
+    @abstractmethod
+    def remove_document(self, filename: str) -> bool:
+        """Remove a document; returns False if it is not stored."""
+    
+    @abstractmethod
+    def postings(self, term: str) -> Tuple[Sequence[int], Sequence[int]]:
+        """The ids of the documents containing term and its frequency in each."""
+    
+    @abstractmethod
+    def document_stats(self, document_id: int) -> Optional[DocumentStats]:
+        """Statistics of a document, or None if it is not stored."""
+    
+    @abstractmethod
+    def collection_stats(self) -> CollectionStats:
+        """Number of documents and words in the collection."""
+    
+    @abstractmethod
+    def documents(self) -> Iterator[Tuple[int, DocumentStats]]:
+        """Every document's id and statistics, by ascending id."""
+    
+    @abstractmethod
+    def terms(self) -> Iterator[str]:
+        """Every term with postings, in sorted order."""
+    
+    def doc_freq(self, term: str) -> int:
+        """Number of documents containing term."""
+        return len(self.postings(term)[0])
+    
+    def transaction(self):
+        """Context manager grouping writes that should be committed together."""
+        return contextlib.nullcontext()
+    
+    def close(self):
+        """Release the backend's resources."""
+
+
+class MemoryStorage(StorageBackend):
+    """Storage backend held in dictionaries; nothing is persisted."""
+    
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._documents: Dict[int, DocumentStats] = {}
+        self._document_terms: Dict[int, List[str]] = {}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._next_id = 1
+        self._total_words = 0
+        self._generation = 0
+    
+    def add_document(self, filename: str, term_counts: Dict[str, int], word_count: int,
+                     text="", links: Iterable[str] = (),
+                     positions: Optional[Dict[str, List[int]]] = None,
+                     pages=None) -> int:
+        """Add a document, replacing any document with the same filename; returns its id."""
+        document_id = self._ids.get(filename)
+        if document_id is not None:
+            # Re-adding keeps the id, like the SQLite backend
+            self._drop_postings(document_id)
+            self._total_words -= self._documents[document_id].word_count
+        else:
+            document_id = self._next_id
+            self._next_id += 1
+            self._ids[filename] = document_id
+        self._documents[document_id] = DocumentStats(filename, word_count)
+        self._document_terms[document_id] = list(term_counts)
+        for term, count in term_counts.items():
+            self._postings.setdefault(term, {})[document_id] = count
+        self._total_words += word_count
+        self._generation += 1
+        return document_id
+    
+    def remove_document(self, filename: str) -> bool:
+        """Remove a document; returns False if it is not stored."""
+        document_id = self._ids.pop(filename, None)
+        if document_id is None:
+            return False
+        self._drop_postings(document_id)
+        self._total_words -= self._documents.pop(document_id).word_count
+        self._generation += 1
+        return True
+    
+    def _drop_postings(self, document_id: int):
+        """Delete a document's postings, and terms left without any."""
+        for term in self._document_terms.pop(document_id):
+            postings = self._postings[term]
+            del postings[document_id]
+            if not postings:
+                del self._postings[term]
+    
+    def postings(self, term: str) -> Tuple[Sequence[int], Sequence[int]]:
+        """The ids of the documents containing term and its frequency in each."""
+        postings = sorted(self._postings.get(term, {}).items())
+        return (array('q', (document_id for document_id, count in postings)),
+                array('q', (count for document_id, count in postings)))
+    
+    def doc_freq(self, term: str) -> int:
+        """Number of documents containing term."""
+        return len(self._postings.get(term, ()))
+    
+    def document_stats(self, document_id: int) -> Optional[DocumentStats]:
+        """Statistics of a document, or None if it is not stored."""
+        return self._documents.get(document_id)
+    
+    def collection_stats(self) -> CollectionStats:
+        """Number of documents and words in the collection."""
+        return CollectionStats(len(self._documents), self._total_words, self._generation)
+    
+    def documents(self) -> Iterator[Tuple[int, DocumentStats]]:
+        """Every document's id and statistics, by ascending id."""
+        return iter(sorted(self._documents.items()))
+    
+    def terms(self) -> Iterator[str]:
+        """Every term with postings, in sorted order."""
+        return iter(sorted(self._postings))
+
+
+# Segment files start with this tag, then the header fields below
+SEGMENT_MAGIC = b'PDFSEG02'
+# magic, database UUID (zeros if none), generation, total docs, total
+# words, document, term and posting counts, then the byte offset of each
+# section in SEGMENT_SECTIONS order
+SEGMENT_SECTIONS = ('document_ids', 'word_counts', 'pageranks', 'name_offsets', 'names',
+                    'term_offsets', 'terms', 'posting_starts', 'max_tf_scores',
+                    'posting_documents', 'frequencies', 'tf_scores')
+SEGMENT_HEADER = struct.Struct('<8s16sddd3Q' + 'Q' * len(SEGMENT_SECTIONS))
+
+
+def write_segment(path: str, generation: float, total_docs: float, total_words: float,
+                  documents: Iterable[Tuple[int, str, int, Optional[float]]],
+                  postings: Iterable[Tuple[str, Sequence[int], Sequence[int],
+                                           Sequence[float]]],
+                  database_id: str = ''):
+    """Write a segment file from documents and term postings.
+
+    documents are (id, filename, word count, PageRank) tuples and postings
+    (term, document ids, frequencies, TF scores) tuples with ascending
+    document ids. database_id is the UUID of the database the segment is
+    a snapshot of. The file is written next to path and renamed over it, so
+    processes that have the old segment mapped keep a consistent view.
+    """
+    documents = sorted(documents)
+    document_ids = array('q', (document[0] for document in documents))
+    word_counts = array('q', (document[2] for document in documents))
+    # NaN marks a document without PageRank
+    pageranks = array('d', (math.nan if document[3] is None else document[3]
+                            for document in documents))
+    names = bytearray()
+    name_offsets = array('q', [0])
+    for document in documents:
+        names += document[1].encode('utf-8')
+        name_offsets.append(len(names))
+
+    terms = bytearray()
+    term_offsets = array('q', [0])
+    posting_starts = array('q', [0])
+    max_tf_scores = array('d')
+    posting_documents, frequencies, tf_scores = array('q'), array('q'), array('d')
+    # The dictionary is sorted by the terms' UTF-8 bytes for binary search
+    for term, term_documents, term_frequencies, term_tf_scores in sorted(
+            postings, key=lambda item: item[0].encode('utf-8')):
+        terms += term.encode('utf-8')
+        term_offsets.append(len(terms))
+        posting_documents.extend(term_documents)
+        frequencies.extend(term_frequencies)
+        tf_scores.extend(term_tf_scores)
+        posting_starts.append(len(posting_documents))
+        max_tf_scores.append(max(term_tf_scores, default=0.0))
+
+    sections = dict(document_ids=document_ids, word_counts=word_counts, pageranks=pageranks,
+                    name_offsets=name_offsets, names=names, term_offsets=term_offsets,
+                    terms=terms, posting_starts=posting_starts, max_tf_scores=max_tf_scores,
+                    posting_documents=posting_documents, frequencies=frequencies,
+                    tf_scores=tf_scores)
+    # A unique name per writer: threads and processes may rewrite the same
+    # segment at once, and the last rename wins
+    temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temporary, 'wb') as segment:
+            segment.write(bytes(SEGMENT_HEADER.size))
+            offsets = []
+            for name in SEGMENT_SECTIONS:
+                # Sections start 8-byte aligned so they cast to 8-byte items
+                segment.write(bytes(-segment.tell() % 8))
+                offsets.append(segment.tell())
+                segment.write(sections[name])
+            segment.seek(0)
+            identity = uuid.UUID(database_id).bytes if database_id else bytes(16)
+            segment.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, identity, generation, total_docs,
+                                              total_words, len(document_ids),
+                                              len(term_offsets) - 1, len(posting_documents),
+                                              *offsets))
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+class _SegmentTerms(Mapping):
+    """Read-only mapping of a segment's terms to their (start, end) posting slices."""
+    
+    def __init__(self, segment: 'SegmentStorage'):
+        self.segment = segment
+    
+    def __getitem__(self, term: str) -> Tuple[int, int]:
+        index = self.segment._term_index(term)
+        if index is None:
+            raise KeyError(term)
+        starts = self.segment._posting_starts
+        return starts[index], starts[index + 1]
+    
+    def __iter__(self) -> Iterator[str]:
+        return self.segment.terms()
+    
+    def __len__(self) -> int:
+        return self.segment.term_count
+
+
+class _SegmentMaxScores(Mapping):
+    """Read-only mapping of a segment's terms to their highest TF score."""
+    
+    def __init__(self, segment: 'SegmentStorage'):
+        self.segment = segment
+    
+    def __getitem__(self, term: str) -> float:
+        index = self.segment._term_index(term)
+        if index is None:
+            raise KeyError(term)
+        return self.segment._max_tf_scores[index]
+    
+    def __iter__(self) -> Iterator[str]:
+        return self.segment.terms()
+    
+    def __len__(self) -> int:
+        return self.segment.term_count
+
+
+class SegmentStorage(StorageBackend):
+    """Immutable segment file opened with mmap.
+    
+    The file holds the documents, a term dictionary sorted for binary
+    search and, for all terms in dictionary order, packed arrays of
+    document ids, frequencies and TF scores. postings() and the
+    ``doc_ids``, ``frequencies`` and ``tf_scores`` arrays are memoryviews
+    of the mapped file, so nothing is copied and processes mapping the
+    same file share it in the page cache. Segments cannot be changed;
+    write a new one with SegmentStorage.write().
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as segment:
+            self._mmap = mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap.size() < SEGMENT_HEADER.size or \
+                self._mmap[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a segment file")
+        (magic, identity, self.generation, self.total_docs, self.total_words,
+         self.document_count, self.term_count, self.posting_count,
+         *offsets) = SEGMENT_HEADER.unpack_from(self._mmap)
+        self.database_id = str(uuid.UUID(bytes=identity)) if any(identity) else ''
+        self._view = memoryview(self._mmap)
+        sections = dict(zip(SEGMENT_SECTIONS, offsets))
+        
+        def section(name, format, length):
+            start = sections[name]
+            return self._view[start:start + 8 * length].cast(format)
+        
+        documents, terms, postings = self.document_count, self.term_count, self.posting_count
+        self._document_ids = section('document_ids', 'q', documents)
+        self._word_counts = section('word_counts', 'q', documents)
+        self._pageranks = section('pageranks', 'd', documents)
+        self._name_offsets = section('name_offsets', 'q', documents + 1)
+        self._names = self._view[sections['names']:]
+        self._term_offsets = section('term_offsets', 'q', terms + 1)
+        self._terms = self._view[sections['terms']:]
+        self._posting_starts = section('posting_starts', 'q', terms + 1)
+        self._max_tf_scores = section('max_tf_scores', 'd', terms)
+        self.doc_ids = section('posting_documents', 'q', postings)
+        self.frequencies = section('frequencies', 'q', postings)
+        self.tf_scores = section('tf_scores', 'd', postings)
+        self.term_slices = _SegmentTerms(self)
+        self.max_tf_scores = _SegmentMaxScores(self)
+    
+    @classmethod
+    def write(cls, path: str, storage: StorageBackend) -> 'SegmentStorage':
+        """Write the contents of any storage backend to a segment file and open it."""
+        stats = storage.collection_stats()
+        documents = [(document_id, document.filename, document.word_count, document.pagerank)
+                     for document_id, document in storage.documents()]
+        word_counts = {document_id: word_count
+                       for document_id, filename, word_count, rank in documents}
+        
+        def postings():
+            for term in storage.terms():
+                document_ids, frequencies = storage.postings(term)
+                yield (term, document_ids, frequencies,
+                       [frequency / (word_counts[document_id] or 1)
+                        for document_id, frequency in zip(document_ids, frequencies)])
+        
+        write_segment(path, stats.generation, stats.total_docs, stats.total_words,
+                      documents, postings(), stats.database_id)
+        return cls(path)
+    
+    def close(self):
+        """Unmap the segment; arrays taken from it must no longer be used."""
+        for view in (self._document_ids, self._word_counts, self._pageranks,
+                     self._name_offsets, self._names, self._term_offsets, self._terms,
+                     self._posting_starts, self._max_tf_scores, self.doc_ids,
+                     self.frequencies, self.tf_scores, self._view):
+            view.release()
+        self._mmap.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _term(self, index: int) -> bytes:
+        """The UTF-8 bytes of the dictionary's index-th term."""
+        return bytes(self._terms[self._term_offsets[index]:self._term_offsets[index + 1]])
+    
+    def _term_index(self, term: str) -> Optional[int]:
+        """Position of term in the dictionary, by binary search, or None."""
+        key = term.encode('utf-8')
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.term_count and self._term(low) == key:
+            return low
+        return None
+    
+    def add_document(self, filename: str, term_counts: Dict[str, int], word_count: int,
+                     text="", links: Iterable[str] = (),
+                     positions: Optional[Dict[str, List[int]]] = None,
+                     pages=None) -> int:
+        raise io.UnsupportedOperation("Segments are immutable; write a new segment instead")
+    
+    def remove_document(self, filename: str) -> bool:
+        raise io.UnsupportedOperation("Segments are immutable; write a new segment instead")
+    
+    def postings(self, term: str) -> Tuple[Sequence[int], Sequence[int]]:
+        """The ids of the documents containing term and its frequency in each."""
+        start, end = self.term_slices.get(term, (0, 0))
+        return self.doc_ids[start:end], self.frequencies[start:end]
+    
+    def doc_freq(self, term: str) -> int:
+        """Number of documents containing term."""
+        start, end = self.term_slices.get(term, (0, 0))
+        return end - start
+    
+    def _document(self, index: int) -> DocumentStats:
+        """Statistics of the index-th document."""
+        name = self._names[self._name_offsets[index]:self._name_offsets[index + 1]]
+        rank = self._pageranks[index]
+        return DocumentStats(bytes(name).decode('utf-8'), self._word_counts[index],
+                             None if math.isnan(rank) else rank)
+    
+    def document_stats(self, document_id: int) -> Optional[DocumentStats]:
+        """Statistics of a document, or None if it is not stored."""
+        index = bisect_left(self._document_ids, document_id)
+        if index < self.document_count and self._document_ids[index] == document_id:
+            return self._document(index)
+        return None
+    
+    def collection_stats(self) -> CollectionStats:
+        """Number of documents and words in the collection."""
+        return CollectionStats(int(self.total_docs), int(self.total_words), self.generation,
+                               self.database_id)
+    
+    def documents(self) -> Iterator[Tuple[int, DocumentStats]]:
+        """Every document's id and statistics, by ascending id."""
+        for index in range(self.document_count):
+            yield self._document_ids[index], self._document(index)
+    
+    def terms(self) -> Iterator[str]:
+        """Every term with postings, in sorted order."""
+        for index in range(self.term_count):
+            yield self._term(index).decode('utf-8')
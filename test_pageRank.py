@@ -0,0 +1,337 @@
+"""
+Regression tests for PDFTextAnalyzer.
+
+Documents are written straight to the analyzer's storage, like the
+benchmarks do, so no PDF files are needed.
+
+Usage:
+    python -m pytest -q
+"""
+import io
+import random
+import sqlite3
+
+import pytest
+
+from pageRank import FTS5_AVAILABLE, PDFTextAnalyzer, SQLiteStorage
+from storage import MemoryStorage
+
+
+def add_document(analyzer: PDFTextAnalyzer, filename: str, text: str, links=()):
+    """Index text as a document linking to links, skipping PDF extraction."""
+    term_counts, word_count, page_counts, positions = analyzer.count_page_terms(
+        [text], analyzer.positional)
+    analyzer.storage.add_document(filename, term_counts, word_count, text, links, positions)
+
+
+@pytest.fixture
+def analyzer(tmp_path):
+    with PDFTextAnalyzer(str(tmp_path / "index.db"), result_cache_size=0) as analyzer:
+        yield analyzer
+
+
+def test_trailing_question_mark_is_punctuation(analyzer):
+    add_document(analyzer, "stats.pdf", "data analysis of survey data")
+    add_document(analyzer, "ml.pdf", "machine learning models")
+    add_document(analyzer, "cooking.pdf", "recipes for bread")
+
+    assert analyzer.search("data analysis?") == analyzer.search("data analysis")
+    assert analyzer.search("machine learning?") == analyzer.search("machine learning")
+    assert analyzer.search("data AND analysis?") == analyzer.search("data AND analysis")
+
+
+def test_question_mark_inside_a_word_is_a_wildcard(analyzer):
+    add_document(analyzer, "science.pdf", "women in science")
+    add_document(analyzer, "cooking.pdf", "recipes for bread")
+
+    assert [filename for filename, score in analyzer.search("wom?n")] == ["science.pdf"]
+
+
+@pytest.mark.skipif(not FTS5_AVAILABLE, reason="SQLite is built without FTS5")
+def test_fts5_query_without_search_terms(tmp_path):
+    with PDFTextAnalyzer(str(tmp_path / "index.db"), engine='fts5',
+                         result_cache_size=0) as analyzer:
+        add_document(analyzer, "ml.pdf", "machine learning models")
+
+        assert analyzer.search("the and of ?", engine='fts5') == []
+        results = dict(analyzer.search_many(["machine", "the and of ?", "learning"],
+                                            engine='fts5'))
+        assert results["the and of ?"] == []
+        assert [filename for filename, score in results["learning"]] == ["ml.pdf"]
+
+
+@pytest.mark.skipif(not FTS5_AVAILABLE, reason="SQLite is built without FTS5")
+def test_fts5_index_follows_writes_from_other_engines(tmp_path):
+    db_path = str(tmp_path / "index.db")
+    with PDFTextAnalyzer(db_path, result_cache_size=0) as analyzer:
+        add_document(analyzer, "ml.pdf", "machine learning models")
+    with PDFTextAnalyzer(db_path, engine='fts5', result_cache_size=0):
+        pass
+    with PDFTextAnalyzer(db_path, result_cache_size=0) as analyzer:
+        add_document(analyzer, "stats.pdf", "statistical learning theory")
+        analyzer.remove_document("ml.pdf")
+
+        conn = analyzer.connections.connection()
+        changes = conn.total_changes
+        results = analyzer.search("learning", engine='fts5')
+        assert [filename for filename, score in results] == ["stats.pdf"]
+        assert conn.total_changes == changes
+
+
+def test_segment_of_a_rebuilt_database_is_rewritten(tmp_path):
+    db_path = str(tmp_path / "index.db")
+    with PDFTextAnalyzer(db_path, result_cache_size=0) as analyzer:
+        add_document(analyzer, "old.pdf", "machine learning models")
+        add_document(analyzer, "cooking.pdf", "recipes for bread")
+        assert [filename for filename, score in analyzer.search("learning", engine='segment')] \
+            == ["old.pdf"]
+    for path in tmp_path.glob("index.db*"):
+        if path.suffix != ".segment":
+            path.unlink()
+
+    # The new database reaches the generation the old segment was written at
+    with PDFTextAnalyzer(db_path, result_cache_size=0) as analyzer:
+        add_document(analyzer, "new.pdf", "deep learning networks")
+        add_document(analyzer, "baking.pdf", "recipes for cake")
+        assert [filename for filename, score in analyzer.search("learning", engine='segment')] \
+            == ["new.pdf"]
+
+
+def test_opening_an_up_to_date_database_needs_no_write_lock(tmp_path):
+    db_path = str(tmp_path / "index.db")
+    with PDFTextAnalyzer(db_path, result_cache_size=0) as analyzer:
+        add_document(analyzer, "ml.pdf", "machine learning models")
+        add_document(analyzer, "cooking.pdf", "recipes for bread")
+
+    writer = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        writer.execute("BEGIN IMMEDIATE")
+        writer.execute("DELETE FROM documents")
+        with PDFTextAnalyzer(db_path, result_cache_size=0) as analyzer:
+            assert [filename for filename, score in analyzer.search("learning")] == ["ml.pdf"]
+    finally:
+        writer.rollback()
+        writer.close()
+
+
+def test_pagerank_is_recomputed_only_when_links_change(analyzer):
+    add_document(analyzer, "a.pdf", "machine learning models", links=["b.pdf"])
+    add_document(analyzer, "b.pdf", "deep learning networks")
+    cursor = analyzer.connections.connection().cursor()
+    analyzer._ensure_pagerank(cursor)
+    ranks = dict(cursor.execute("SELECT filename, pagerank FROM documents"))
+    assert ranks["b.pdf"] > ranks["a.pdf"]
+
+    # A document outside the link graph leaves the ranks and the generation alone
+    add_document(analyzer, "c.pdf", "recipes for bread")
+    generation = analyzer.database.collection_stat(cursor, 'generation')
+    analyzer._ensure_pagerank(cursor)
+    assert analyzer.database.collection_stat(cursor, 'generation') == generation
+    assert dict(cursor.execute("SELECT filename, pagerank FROM documents")) \
+        == dict(ranks, **{"c.pdf": None})
+
+    # Once the ranks have converged, recomputing writes nothing
+    analyzer.compute_pagerank()
+    generation = analyzer.database.collection_stat(cursor, 'generation')
+    analyzer.compute_pagerank()
+    assert analyzer.database.collection_stat(cursor, 'generation') == generation
+
+
+def test_replaced_segment_is_unmapped(analyzer):
+    add_document(analyzer, "ml.pdf", "machine learning models")
+    add_document(analyzer, "cooking.pdf", "recipes for bread")
+    results = analyzer.search_many(["learning", "bread"], engine='segment')
+    next(results)
+    old = analyzer._indexes['segment'].segment
+
+    add_document(analyzer, "dl.pdf", "deep learning networks")
+    analyzer.search("learning", engine='segment')
+    # Still in use by the unfinished search_many
+    assert not old._mmap.closed
+    results.close()
+    assert old._mmap.closed
+
+
+def test_baseline_database_is_upgraded_in_place(tmp_path):
+    db_path = str(tmp_path / "index.db")
+    # The schema and rows written by the first release, before versioning
+    conn = sqlite3.connect(db_path)
+    conn.executescript('''
+        CREATE TABLE documents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT UNIQUE NOT NULL,
+            content TEXT NOT NULL,
+            word_count INTEGER
+        );
+        CREATE TABLE term_frequency (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            document_id INTEGER,
+            term TEXT,
+            frequency INTEGER,
+            tf_score REAL,
+            FOREIGN KEY (document_id) REFERENCES documents (id),
+            UNIQUE(document_id, term)
+        );
+        INSERT INTO documents VALUES (1, 'ml.pdf', 'machine learning models', 3);
+        INSERT INTO documents VALUES (2, 'cooking.pdf', 'recipes for bread', 3);
+        INSERT INTO term_frequency (document_id, term, frequency, tf_score) VALUES
+            (1, 'machine', 1, 0.5), (1, 'learning', 1, 0.5),
+            (2, 'recipes', 1, 0.5), (2, 'bread', 1, 0.5);
+    ''')
+    conn.close()
+
+    with PDFTextAnalyzer(db_path, result_cache_size=0) as analyzer:
+        cursor = analyzer.connections.connection().cursor()
+        assert analyzer.database._schema_version(cursor) == len(SQLiteStorage.SCHEMA_MIGRATIONS)
+        assert [filename for filename, score in analyzer.search("learning")] == ["ml.pdf"]
+        assert analyzer.get_document_text("cooking.pdf") == "recipes for bread"
+
+        add_document(analyzer, "bakery.pdf", "bread and cake recipes")
+        assert sorted(filename for filename, score in analyzer.search("bread")) \
+            == ["bakery.pdf", "cooking.pdf"]
+
+    # Reopening the upgraded database applies nothing again
+    with PDFTextAnalyzer(db_path, result_cache_size=0) as analyzer:
+        assert [filename for filename, score in analyzer.search("machine")] == ["ml.pdf"]
+
+
+def test_reingest_keeps_the_document_id_and_compact_drops_orphans(analyzer):
+    add_document(analyzer, "ml.pdf", "machine learning models")
+    add_document(analyzer, "cooking.pdf", "recipes for bread")
+    cursor = analyzer.connections.connection().cursor()
+    document_id = cursor.execute("SELECT id FROM documents WHERE filename = 'ml.pdf'").fetchone()
+
+    add_document(analyzer, "ml.pdf", "deep learning networks")
+    assert cursor.execute("SELECT id FROM documents WHERE filename = 'ml.pdf'").fetchone() \
+        == document_id
+    assert cursor.execute('''
+        SELECT t.term FROM term_frequency tf JOIN terms t ON t.id = tf.term_id
+        WHERE tf.document_id = ? ORDER BY t.term
+    ''', document_id).fetchall() == [("deep",), ("learning",), ("networks",)]
+    assert analyzer.search("machine") == []
+    assert analyzer.database.collection_stat(cursor, 'total_docs') == 2
+
+    # Rows left behind by documents older versions re-inserted under new ids
+    conn = analyzer.connections.connection()
+    conn.execute('''
+        INSERT INTO term_frequency (document_id, term_id, frequency, tf_score)
+        SELECT 999, term_id, frequency, tf_score FROM term_frequency WHERE document_id = ?
+    ''', document_id)
+    conn.commit()
+    analyzer.compact()
+    assert cursor.execute('''
+        SELECT COUNT(*) FROM term_frequency WHERE document_id NOT IN (SELECT id FROM documents)
+    ''').fetchone() == (0,)
+    assert [filename for filename, score in analyzer.search("networks")] == ["ml.pdf"]
+
+
+@pytest.mark.parametrize("engine", ["sql", "memory"])
+def test_boolean_operator_precedence(analyzer, engine):
+    add_document(analyzer, "ab.pdf", "alpha beta")
+    add_document(analyzer, "g.pdf", "gamma")
+    add_document(analyzer, "ag.pdf", "alpha gamma")
+    add_document(analyzer, "bd.pdf", "beta delta")
+    add_document(analyzer, "z.pdf", "zeta")
+
+    def matches(query):
+        return sorted(filename for filename, score in analyzer.search(query, engine=engine))
+
+    # AND binds tighter than OR, NOT tighter than AND
+    assert matches("alpha OR beta AND gamma") == ["ab.pdf", "ag.pdf"]
+    assert matches("(alpha OR beta) AND gamma") == ["ag.pdf"]
+    assert matches("NOT alpha AND beta") == ["bd.pdf"]
+    assert matches("alpha AND NOT gamma") == ["ab.pdf"]
+    assert matches("gamma +alpha") == ["ab.pdf", "ag.pdf"]
+    assert matches("beta -alpha") == ["bd.pdf"]
+
+
+@pytest.mark.parametrize("ranking", ["tfidf", "bm25"])
+@pytest.mark.parametrize("pagerank_weight", [0.0, 0.5])
+def test_maxscore_top_k_matches_exhaustive_scoring(analyzer, ranking, pagerank_weight):
+    rng = random.Random(13)
+    vocabulary = [f"term{letter}" for letter in "abcdefghijklmnop"]
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    for i in range(60):
+        links = [f"doc{rng.randrange(60)}.pdf" for _ in range(rng.randint(0, 3))]
+        add_document(analyzer, f"doc{i}.pdf",
+                     " ".join(rng.choices(vocabulary, weights, k=rng.randint(5, 40))), links)
+    analyzer.compute_pagerank()
+
+    for _ in range(30):
+        query = " ".join(rng.sample(vocabulary, rng.randint(1, 4)))
+        options = dict(ranking=ranking, pagerank_weight=pagerank_weight)
+        exhaustive = analyzer.search(query, top_n=1000, engine='sql', **options)
+        for top_n in (1, 3, 10):
+            pruned = analyzer.search(query, top_n=top_n, engine='memory', **options)
+            assert [filename for filename, score in pruned] \
+                == [filename for filename, score in exhaustive[:top_n]]
+            assert [score for filename, score in pruned] \
+                == pytest.approx([score for filename, score in exhaustive[:top_n]])
+
+
+def test_phrase_and_near_queries_use_token_positions(tmp_path):
+    with PDFTextAnalyzer(str(tmp_path / "index.db"), positional=True,
+                         result_cache_size=0) as analyzer:
+        add_document(analyzer, "ml.pdf", "machine learning models for vision")
+        add_document(analyzer, "reversed.pdf", "learning machine models")
+        add_document(analyzer, "apart.pdf", "machine vision and deep learning")
+        add_document(analyzer, "cooking.pdf", "recipes for bread")
+
+        def matches(query):
+            return sorted(filename for filename, score in analyzer.search(query))
+
+        assert matches('"machine learning"') == ["ml.pdf"]
+        assert matches('"learning machine"') == ["reversed.pdf"]
+        # Stop words count as tokens, so they keep phrase words apart
+        assert matches('"vision and deep"') == ["apart.pdf"]
+        assert matches('"vision deep"') == []
+        # NEAR/n allows n tokens between the words, in either order
+        assert matches("machine NEAR/1 learning") == ["ml.pdf", "reversed.pdf"]
+        assert matches("machine NEAR/2 learning") == ["ml.pdf", "reversed.pdf"]
+        assert matches("machine NEAR/3 learning") == ["apart.pdf", "ml.pdf", "reversed.pdf"]
+        assert matches('"machine learning" AND models') == ["ml.pdf"]
+
+
+def test_misspelled_words_are_corrected_from_the_deletion_index(analyzer):
+    add_document(analyzer, "ml.pdf", "machine learning models")
+    add_document(analyzer, "cooking.pdf", "recipes for bread")
+
+    assert analyzer.search("lerning") == analyzer.search("learning")
+    assert analyzer.search("machnie models") == analyzer.search("machine models")
+    assert [filename for filename, score in analyzer.search("bred")] == ["cooking.pdf"]
+    # Words too far from every indexed term are not corrected
+    assert analyzer.search("xylophone") == []
+
+
+def test_spelling_correction_can_be_turned_off(tmp_path):
+    with PDFTextAnalyzer(str(tmp_path / "index.db"), max_edit_distance=0,
+                         result_cache_size=0) as analyzer:
+        add_document(analyzer, "ml.pdf", "machine learning models")
+        add_document(analyzer, "cooking.pdf", "recipes for bread")
+        assert analyzer.search("lerning") == []
+
+
+def test_analyzer_stores_documents_in_any_storage_backend(capsys):
+    storage = MemoryStorage()
+    with PDFTextAnalyzer(storage=storage, result_cache_size=0) as analyzer:
+        assert analyzer.engine == 'memory'
+        add_document(analyzer, "ml.pdf", "machine learning models")
+        add_document(analyzer, "stats.pdf", "statistical learning theory")
+        add_document(analyzer, "cooking.pdf", "recipes for bread")
+        assert analyzer.search("machine learning")[0][0] == "ml.pdf"
+
+        assert analyzer.remove_document("ml.pdf")
+        assert [filename for filename, score in analyzer.search("learning")] == ["stats.pdf"]
+        assert sorted(document.filename for document_id, document in storage.documents()) \
+            == ["cooking.pdf", "stats.pdf"]
+        capsys.readouterr()
+        analyzer.list_documents()
+        assert "stats.pdf (3 words)" in capsys.readouterr().out
+
+        # Features built on SQL refuse other backends
+        with pytest.raises(io.UnsupportedOperation):
+            analyzer.search("learn*")
+        with pytest.raises(io.UnsupportedOperation):
+            analyzer.compact()
+    with pytest.raises(io.UnsupportedOperation):
+        PDFTextAnalyzer(storage=MemoryStorage(), engine='sql')